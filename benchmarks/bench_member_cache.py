@@ -0,0 +1,204 @@
+"""
+Compare memory and startup work of the default member cache with --lean.
+
+    python benchmarks/bench_member_cache.py [--guilds 20] [--members 5000] [--dinner-size 30]
+
+Feeds synthetic GUILD_CREATE and GUILD_MEMBERS_CHUNK payloads through
+discord.py's own connection state. By default every guild is chunked before
+the bot is ready, with --lean nothing is chunked at startup and only the
+dinner channel's guild is chunked once a dinner gets scheduled. Times are the
+processing of those payloads only, the gateway round trips for chunking come
+on top and grow with the number of guilds chunked. Also measures
+the memory held by a cached dinner's pairing records. Results are printed as
+json.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "peachorobo"))
+
+from discord import Intents  # noqa: E402
+from discord.state import ChunkRequest, ConnectionState  # noqa: E402
+
+from bot import get_member_cache_options, intents  # noqa: E402
+from fakes import FakeBot, make_users  # noqa: E402
+from utils import deserialize_mystery_dinner, serialize_pairing  # noqa: E402
+
+# discord only sends offline members of guilds above this in chunks
+LARGE_THRESHOLD = 250
+MEMBERS_PER_CHUNK = 1000
+JOINED_AT = datetime(2021, 1, 1).isoformat()
+
+
+def make_member(user_id: int) -> dict:
+    return {
+        "user": {
+            "id": str(user_id),
+            "username": f"user{user_id}",
+            "discriminator": "0001",
+            "avatar": None,
+        },
+        "roles": [],
+        "joined_at": JOINED_AT,
+        "deaf": False,
+        "mute": False,
+        "nick": None,
+    }
+
+
+def make_guild(guild_id: int, num_members: int) -> dict:
+    large = num_members > LARGE_THRESHOLD
+    return {
+        "id": str(guild_id),
+        "name": f"guild {guild_id}",
+        "member_count": num_members,
+        "large": large,
+        "members": (
+            []
+            if large
+            else [make_member(guild_id * 10 ** 6 + i) for i in range(num_members)]
+        ),
+        "channels": [
+            {"id": str(guild_id), "type": 0, "name": "general", "position": 0}
+        ],
+        "roles": [],
+        "emojis": [],
+    }
+
+
+def chunk_guild(state: ConnectionState, guild_id: int, num_members: int) -> None:
+    request = ChunkRequest(guild_id, state.loop, state._get_guild)
+    state._chunk_requests[request.nonce] = request
+    chunk_count = -(-num_members // MEMBERS_PER_CHUNK)
+    for chunk_index in range(chunk_count):
+        start = chunk_index * MEMBERS_PER_CHUNK
+        state.parse_guild_members_chunk(
+            {
+                "guild_id": str(guild_id),
+                "nonce": request.nonce,
+                "chunk_index": chunk_index,
+                "chunk_count": chunk_count,
+                "members": [
+                    make_member(guild_id * 10 ** 6 + i)
+                    for i in range(start, min(start + MEMBERS_PER_CHUNK, num_members))
+                ],
+            }
+        )
+
+
+def _create_state(lean: bool, loop: asyncio.AbstractEventLoop) -> ConnectionState:
+    return ConnectionState(
+        dispatch=lambda *args, **kwargs: None,
+        handlers={},
+        hooks={},
+        syncer=None,
+        http=None,
+        loop=loop,
+        intents=Intents(**dict(intents)),
+        **get_member_cache_options(lean),
+    )
+
+
+def _start_up(state: ConnectionState, guild_ids: List[int], num_members: int) -> None:
+    for guild_id in guild_ids:
+        # what parse_guild_create does minus the tasks that request the chunks
+        state._get_create_guild(make_guild(guild_id, num_members))
+    if state._chunk_guilds:
+        for guild_id in guild_ids:
+            chunk_guild(state, guild_id, num_members)
+
+
+def _schedule(state: ConnectionState, guild_id: int, num_members: int) -> None:
+    # what handle_invite_confirmed does before pairing
+    if not state._get_guild(guild_id).chunked:
+        chunk_guild(state, guild_id, num_members)
+
+
+def bench_member_cache(lean: bool, num_guilds: int, num_members: int) -> dict:
+    loop = asyncio.new_event_loop()
+    guild_ids = list(range(1, num_guilds + 1))
+
+    # timed and traced separately, tracemalloc slows everything down
+    state = _create_state(lean, loop)
+    started_at = time.perf_counter()
+    _start_up(state, guild_ids, num_members)
+    startup_ms = (time.perf_counter() - started_at) * 1000
+    started_at = time.perf_counter()
+    _schedule(state, guild_ids[0], num_members)
+    schedule_ms = (time.perf_counter() - started_at) * 1000
+    del state
+
+    state = _create_state(lean, loop)
+    tracemalloc.start()
+    _start_up(state, guild_ids, num_members)
+    ready_bytes = tracemalloc.get_traced_memory()[0]
+    _schedule(state, guild_ids[0], num_members)
+    scheduled_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    cached_members = sum(len(guild.members) for guild in state.guilds)
+    loop.close()
+    return {
+        "mode": "lean" if lean else "default",
+        "guilds": num_guilds,
+        "members_per_guild": num_members,
+        "startup_processing_ms": startup_ms,
+        "memory_at_ready_mb": ready_bytes / 2 ** 20,
+        "schedule_chunk_ms": schedule_ms,
+        "memory_after_schedule_mb": scheduled_bytes / 2 ** 20,
+        "cached_members": cached_members,
+    }
+
+
+def bench_dinner_records(dinner_size: int) -> dict:
+    users = make_users(dinner_size, 0)
+    serialized = {
+        "pairings": [
+            serialize_pairing(user, users[(i + 1) % dinner_size])
+            for i, user in enumerate(users)
+        ],
+        "calendar": {"id": "event", "uri": None},
+        "datetime_iso": JOINED_AT,
+        "id": 1,
+    }
+    bot = FakeBot(users)
+    deserialize_mystery_dinner(serialized, bot)
+    tracemalloc.start()
+    dinner = deserialize_mystery_dinner(serialized, bot)
+    dinner_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {
+        "dinner_size": len(dinner.pairings),
+        "dinner_record_bytes": dinner_bytes,
+        "bytes_per_pairing": dinner_bytes / dinner_size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--members", type=int, default=5000)
+    parser.add_argument("--dinner-size", type=int, default=30)
+    args = parser.parse_args()
+    results = {
+        "member_cache": [
+            bench_member_cache(lean, args.guilds, args.members)
+            for lean in (False, True)
+        ],
+        "dinner_records": bench_dinner_records(args.dinner_size),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
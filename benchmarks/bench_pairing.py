@@ -0,0 +1,80 @@
+"""
+Measure the pairing engine's generation time and repeat rate.
+
+    python benchmarks/bench_pairing.py [--rosters 10 100 1000 5000] [--depths 0 1 5 20]
+
+History is made of random single cycles over the roster, like make_pairings
+produced before it looked at history, and a tenth of the roster is split into
+excluded couples. The repeat rate is the fraction of pairs that also appear in
+the history, next to what a plain random cycle would get. Results are printed
+as json.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "peachorobo"))
+
+from pairing import PairingCosts, count_repeats, make_cycle  # noqa: E402
+
+# fraction of the roster that is in an excluded couple
+COUPLES_FRACTION = 0.1
+
+
+def random_cycle_pairs(member_ids, rng):
+    order = list(member_ids)
+    rng.shuffle(order)
+    return [
+        (giver_id, order[(position + 1) % len(order)])
+        for position, giver_id in enumerate(order)
+    ]
+
+
+def bench(roster: int, depth: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    member_ids = list(range(1, roster + 1))
+    history = [random_cycle_pairs(member_ids, rng) for _ in range(depth)]
+    couples = int(roster * COUPLES_FRACTION) // 2
+    exclusions = [(2 * i + 1, 2 * i + 2) for i in range(couples)]
+    costs = PairingCosts(history, exclusions)
+
+    started_at = time.perf_counter()
+    order = make_cycle(member_ids, costs, rng=rng)
+    elapsed = time.perf_counter() - started_at
+
+    repeats = count_repeats(order, costs)
+    random_order = list(member_ids)
+    rng.shuffle(random_order)
+    return {
+        "roster": roster,
+        "history_depth": depth,
+        "excluded_couples": couples,
+        "generation_ms": elapsed * 1000,
+        "repeats": repeats,
+        "repeat_rate": repeats / roster,
+        "random_repeat_rate": count_repeats(random_order, costs) / roster,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rosters", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--depths", type=int, nargs="+", default=[0, 1, 5, 20])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    results = [
+        bench(roster, depth, args.seed)
+        for roster in args.rosters
+        for depth in args.depths
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compare the targeted Etsy sales extractor against the full BeautifulSoup parse.
+
+    python benchmarks/bench_sales_extractor.py [--page saved_shop_page.html ...]
+
+Without --page it runs against generated shop pages of a few sizes, with the
+sold link near the top like on etsy.com. Results are printed as json.
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "peachorobo"))
+
+from fakes import make_shop_page  # noqa: E402
+from wack_utils import _extract_num_sales, _parse_num_sales_with_soup  # noqa: E402
+
+
+def bench(name: str, page: str, number: int) -> dict:
+    targeted = timeit.timeit(lambda: _extract_num_sales(page), number=number)
+    soup = timeit.timeit(lambda: _parse_num_sales_with_soup(page), number=number)
+    assert _extract_num_sales(page) == _parse_num_sales_with_soup(page)
+    return {
+        "page": name,
+        "page_bytes": len(page.encode()),
+        "iterations": number,
+        "targeted_ms": targeted / number * 1000,
+        "soup_ms": soup / number * 1000,
+        "speedup": soup / targeted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--page", action="append", default=[])
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+    pages = []
+    for path in args.page:
+        with open(path) as f:
+            pages.append((path, f.read()))
+    if not pages:
+        pages = [
+            (f"generated_{num_listings}_listings", make_shop_page(num_listings))
+            for num_listings in (10, 100, 1000)
+        ]
+    results = [bench(name, page, args.number) for name, page in pages]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
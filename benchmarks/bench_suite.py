@@ -0,0 +1,366 @@
+"""
+Benchmark the bot's hot paths offline against in-process fakes.
+
+    python benchmarks/bench_suite.py [--sizes 10 100] [--only make_pairings ...] [--output results.json]
+
+Discord users, channels and contexts, Google Calendar, and the etsy.com,
+cvs.com and stats.nba.com upstreams are all faked (see fakes.py), HTTP goes to
+a stub server on localhost. Every benchmark runs at each size, which is the
+number of participants, plays, listings or cities depending on the benchmark.
+Results are printed as json, tagged with the current commit so runs can be
+compared.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "peachorobo"))
+
+import pytz  # noqa: E402
+
+import calendar_service  # noqa: E402
+import db  # noqa: E402
+import nba  # noqa: E402
+import wack_utils  # noqa: E402
+from bot_utils import (  # noqa: E402
+    handle_invite_confirmed,
+    make_pairings,
+    send_pairings_out,
+)
+from config import peachorobo_config  # noqa: E402
+from db import DBService, DinnerPartition  # noqa: E402
+from fakes import (  # noqa: E402
+    FakeBot,
+    FakeChannel,
+    FakeContext,
+    FakeGoogleCalendar,
+    StubUpstreams,
+    make_cvs_status,
+    make_shop_page,
+    make_users,
+)
+from highlights import NBAHighlights  # noqa: E402
+from http_clients import http_clients  # noqa: E402
+from nba import GameData, PlayData  # noqa: E402
+from utils import deserialize_mystery_dinner, serialize_pairing  # noqa: E402
+from vacwatch import VacWatch  # noqa: E402
+from wackwatch import WackWatch  # noqa: E402
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+# total work per size is roughly constant, so small sizes get more iterations
+WORK_PER_SIZE = 2000
+MAX_ITERATIONS = 20
+
+PARTITION = DinnerPartition(guild_id=1, channel_id=1)
+
+Run = Callable[[], Awaitable[None]]
+Setup = Callable[["BenchContext", int], Awaitable[Run]]
+
+
+class BenchContext:
+    """Temp files and the stub server shared by every benchmark"""
+
+    def __init__(self, tmp_dir: str, upstreams: StubUpstreams):
+        self.tmp_dir = tmp_dir
+        self.upstreams = upstreams
+        self.cleanups: List[Callable[[], None]] = []
+        self._paths = 0
+
+    def path(self, name: str) -> str:
+        self._paths += 1
+        return os.path.join(self.tmp_dir, f"{self._paths}_{name}")
+
+    def use_fresh_db(self, backend: str) -> None:
+        peachorobo_config.db_backend = backend
+        peachorobo_config.db_json_path = self.path("db.json")
+        peachorobo_config.db_sqlite_path = self.path("db.sqlite3")
+        db._partitions.clear()
+
+
+def _make_serialized_dinner(size: int) -> dict:
+    users = make_users(size)
+    return {
+        "id": 0,
+        "calendar": {"id": "event", "uri": "https://meet.google.com/event"},
+        "datetime_iso": (datetime.now(pytz.utc) + timedelta(days=7)).isoformat(),
+        "pairings": [
+            serialize_pairing(pairing.user, pairing.matched_with)
+            for pairing in make_pairings(users)
+        ],
+    }
+
+
+def _make_game(game_id: str, size: int) -> GameData:
+    return GameData(
+        game_id=game_id,
+        game_date=datetime.now().date(),
+        home_team="DEN",
+        away_team="LAL",
+        plays=[
+            PlayData(event_id=event_id, description=f"Play {event_id}")
+            for event_id in range(1, size + 1)
+        ],
+    )
+
+
+async def setup_make_pairings(context: BenchContext, size: int) -> Run:
+    users = make_users(size)
+
+    async def run():
+        make_pairings(users)
+
+    return run
+
+
+async def _setup_db_create(context: BenchContext, size: int, backend: str) -> Run:
+    context.use_fresh_db(backend)
+    pairings = make_pairings(make_users(size))
+    scheduled_time = datetime.now(pytz.utc) + timedelta(days=7)
+    calendar = {"id": "event", "uri": "https://meet.google.com/event"}
+
+    async def run():
+        DBService.create_mystery_dinner(PARTITION, pairings, scheduled_time, calendar)
+
+    return run
+
+
+async def _setup_db_reads(context: BenchContext, size: int, backend: str) -> Run:
+    context.use_fresh_db(backend)
+    users = make_users(size)
+    bot = FakeBot(users)
+    scheduled_time = datetime.now(pytz.utc) + timedelta(days=7)
+    calendar = {"id": "event", "uri": "https://meet.google.com/event"}
+    for _ in range(5):
+        DBService.create_mystery_dinner(
+            PARTITION, make_pairings(users), scheduled_time, calendar
+        )
+
+    async def run():
+        DBService.get_latest_mystery_dinner(PARTITION, bot)
+        DBService.get_mystery_dinners_for_user(PARTITION, bot, users[0].id)
+        DBService.get_upcoming_mystery_dinners(PARTITION, bot)
+
+    return run
+
+
+async def setup_deserialize_mystery_dinner(context: BenchContext, size: int) -> Run:
+    dinner = _make_serialized_dinner(size)
+    bot = FakeBot(make_users(size))
+
+    async def run():
+        deserialize_mystery_dinner(dinner, bot)
+
+    return run
+
+
+async def setup_send_pairings_out(context: BenchContext, size: int) -> Run:
+    pairings = make_pairings(make_users(size))
+
+    async def run():
+        await send_pairings_out(
+            pairings, "Friday at 6:00 PM", "https://meet.google.com"
+        )
+
+    return run
+
+
+async def setup_schedule_confirmed(context: BenchContext, size: int) -> Run:
+    context.use_fresh_db(db.DB_BACKEND_JOURNAL)
+    ctx = FakeContext(FakeChannel(members=make_users(size)))
+    scheduled_time = datetime.now(pytz.utc) + timedelta(days=7)
+
+    async def run():
+        await handle_invite_confirmed(ctx, "Friday at 6:00 PM", scheduled_time)
+
+    return run
+
+
+async def setup_wackwatch(context: BenchContext, size: int) -> Run:
+    num_sales = 1000 + size
+    context.upstreams.shop_page = make_shop_page(size, num_sales)
+    peachorobo_config.wack_last_success_ts_path = context.path("wack_ts")
+    peachorobo_config.wack_num_sales_path = context.path("wack_num_sales")
+    with open(peachorobo_config.wack_num_sales_path, "w") as f:
+        f.write(str(num_sales))
+    ctx = FakeContext(FakeChannel())
+    cog = WackWatch(FakeBot([], ctx.channel))
+    context.cleanups.append(cog.cog_unload)
+
+    async def run():
+        with open(peachorobo_config.wack_last_success_ts_path, "w") as f:
+            f.write(str(time.time()))
+        await cog.watch(ctx=ctx, verbose=True)
+
+    return run
+
+
+async def setup_vacwatch(context: BenchContext, size: int) -> Run:
+    context.upstreams.cvs_status = make_cvs_status(VacWatch.STATE_ABBREV, size)
+    ctx = FakeContext(FakeChannel())
+    cog = VacWatch(FakeBot([], ctx.channel))
+    context.cleanups.append(cog.cvswatch.cancel)
+
+    async def run():
+        await cog.cvswatch(ctx=ctx, verbose=True)
+
+    return run
+
+
+async def setup_highlights_uncached(context: BenchContext, size: int) -> Run:
+    cog = NBAHighlights(FakeBot([]))
+    ctx = FakeContext(FakeChannel())
+    games = 0
+
+    async def run():
+        # a new game every time so each play is fetched from the stub server
+        nonlocal games
+        games += 1
+        await cog._send_highlights(ctx, _make_game(f"uncached{size}_{games}", size))
+
+    return run
+
+
+async def setup_highlights_cached(context: BenchContext, size: int) -> Run:
+    cog = NBAHighlights(FakeBot([]))
+    ctx = FakeContext(FakeChannel())
+    game_data = _make_game(f"cached{size}", size)
+    await cog._send_highlights(ctx, game_data)
+
+    async def run():
+        await cog._send_highlights(ctx, game_data)
+
+    return run
+
+
+def _for_backend(setup, backend: str) -> Setup:
+    async def setup_backend(context: BenchContext, size: int) -> Run:
+        return await setup(context, size, backend)
+
+    return setup_backend
+
+
+BENCHMARKS: Dict[str, Setup] = {
+    "make_pairings": setup_make_pairings,
+    "db_create_journal": _for_backend(_setup_db_create, db.DB_BACKEND_JOURNAL),
+    "db_create_sqlite": _for_backend(_setup_db_create, db.DB_BACKEND_SQLITE),
+    "db_reads_journal": _for_backend(_setup_db_reads, db.DB_BACKEND_JOURNAL),
+    "db_reads_sqlite": _for_backend(_setup_db_reads, db.DB_BACKEND_SQLITE),
+    "deserialize_mystery_dinner": setup_deserialize_mystery_dinner,
+    "send_pairings_out": setup_send_pairings_out,
+    "schedule_confirmed": setup_schedule_confirmed,
+    "wackwatch": setup_wackwatch,
+    "vacwatch": setup_vacwatch,
+    "highlights_uncached": setup_highlights_uncached,
+    "highlights_cached": setup_highlights_cached,
+}
+
+
+def _get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def bench(
+    context: BenchContext, name: str, size: int, iterations: Optional[int]
+) -> dict:
+    iterations = iterations or max(1, min(MAX_ITERATIONS, WORK_PER_SIZE // size))
+    timings = []
+    # the code under test prints progress, keep it out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        run = await BENCHMARKS[name](context, size)
+        for _ in range(iterations):
+            started_at = time.perf_counter()
+            await run()
+            timings.append(time.perf_counter() - started_at)
+    return {
+        "benchmark": name,
+        "size": size,
+        "iterations": iterations,
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "mean_ms": statistics.mean(timings) * 1000,
+    }
+
+
+async def run_benchmarks(
+    names: List[str], sizes: List[int], iterations: Optional[int]
+) -> List[dict]:
+    upstreams = StubUpstreams()
+    await upstreams.start()
+    wack_utils.URL = f"{upstreams.base_url}/shop"
+    VacWatch.CVS_URL = f"{upstreams.base_url}/cvs"
+    nba.VIDEO_EVENTS_ASSET_URL = f"{upstreams.base_url}/stats/videoeventsasset"
+    service = calendar_service.get_calendar_service()
+    service._calendar = FakeGoogleCalendar()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        context = BenchContext(tmp_dir, upstreams)
+        peachorobo_config.http_cache_path = context.path("http_cache.json")
+        peachorobo_config.nba_cache_path = context.path("nba_cache.sqlite3")
+        # the stub always agrees with wack, never back off
+        peachorobo_config.wack_retry_attempts = 1
+        try:
+            for name in names:
+                for size in sizes:
+                    print(f"Running {name} at {size}", file=sys.stderr)
+                    results.append(await bench(context, name, size, iterations))
+        finally:
+            for cleanup in context.cleanups:
+                cleanup()
+            await calendar_service.close_calendar_service()
+            await http_clients.close()
+            await upstreams.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS))
+    parser.add_argument("--iterations", type=int)
+    parser.add_argument("--output", help="write results here instead of stdout")
+    args = parser.parse_args()
+    names = args.only or list(BENCHMARKS)
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(
+        run_benchmarks(names, args.sizes, args.iterations)
+    )
+    output = json.dumps(
+        {
+            "commit": _get_commit(),
+            "python": platform.python_version(),
+            "results": results,
+        },
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
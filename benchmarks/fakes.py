@@ -0,0 +1,250 @@
+"""
+In-process stand-ins for Discord, Google Calendar and the HTTP upstreams, so
+the benchmarks run without a network or any credentials.
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import discord
+from aiohttp import web
+
+from wack_utils import SOLD_HREF
+
+# how long a fake DM takes, roughly a fast discord api round trip
+DEFAULT_SEND_LATENCY_SECONDS = 0.001
+
+
+class FakeUser:
+    """Enough of discord.User/Member for pairing, serializing and DMing"""
+
+    def __init__(self, user_id: int, send_latency: float = 0.0):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.display_name = f"User {user_id}"
+        self.bot = False
+        self.send_latency = send_latency
+        self.sent: List[str] = []
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return self.id
+
+    async def send(self, content: str) -> None:
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+        self.sent.append(content)
+
+
+def make_users(
+    count: int, send_latency: float = DEFAULT_SEND_LATENCY_SECONDS
+) -> List[FakeUser]:
+    return [FakeUser(user_id, send_latency) for user_id in range(1, count + 1)]
+
+
+class FakeMessage:
+    def __init__(self, content: Optional[str]):
+        self.content = content
+
+    async def add_reaction(self, emoji: str) -> None:
+        pass
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.chunked = True
+
+    async def chunk(self) -> None:
+        self.chunked = True
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int = 1, members: Optional[List[FakeUser]] = None):
+        self.id = channel_id
+        self.guild = FakeGuild(1)
+        self.members = members or []
+        self.messages: List[Optional[str]] = []
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        self.messages.append(content)
+        return FakeMessage(content)
+
+
+class FakeContext:
+    """commands.Context as far as the cogs use it, sends go to the fake channel"""
+
+    def __init__(self, channel: FakeChannel, author: Optional[FakeUser] = None):
+        self.channel = channel
+        self.author = author
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+
+class _FakeResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = ""
+
+
+class FakeBot:
+    """Resolves users from a dict like the gateway cache and never becomes ready"""
+
+    def __init__(self, users: List[FakeUser], channel: Optional[FakeChannel] = None):
+        self.users: Dict[int, FakeUser] = {user.id: user for user in users}
+        self.channel = channel or FakeChannel()
+
+    def get_user(self, user_id: int) -> Optional[FakeUser]:
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id: int) -> FakeUser:
+        if user_id not in self.users:
+            raise discord.NotFound(_FakeResponse(404), "Unknown User")
+        return self.users[user_id]
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        return self.channel
+
+    async def wait_until_ready(self) -> None:
+        # keeps tasks.loop iterations from running on their own during a benchmark
+        await asyncio.Event().wait()
+
+
+class _FakeEntryPoint:
+    def __init__(self, uri: str):
+        self.uri = uri
+
+
+class _FakeConferenceSolution:
+    def __init__(self, uri: str):
+        self.entry_points = [_FakeEntryPoint(uri)]
+
+
+class _FakeCredentials:
+    expiry = datetime.utcnow() + timedelta(days=1)
+
+
+class FakeGoogleCalendar:
+    """gcsa's GoogleCalendar, events get a Meet link straight away"""
+
+    def __init__(self):
+        self.credentials = _FakeCredentials()
+        self.events = {}
+
+    def add_event(self, event, **kwargs):
+        event.event_id = f"event{len(self.events)}"
+        event.conference_solution = _FakeConferenceSolution(
+            f"https://meet.google.com/{event.id}"
+        )
+        self.events[event.id] = event
+        return event
+
+    def get_event(self, event_id: str):
+        return self.events[event_id]
+
+    def delete_event(self, event) -> None:
+        self.events.pop(event.id, None)
+
+
+LISTING_TEMPLATE = """
+<li class="wt-list-unstyled listing-{i}">
+  <a class="listing-link" href="https://www.etsy.com/listing/{i}/candle-{i}" data-listing-id="{i}">
+    <img src="https://i.etsystatic.com/{i}/il_340x270.jpg" alt="Candle {i}" />
+    <h3 class="wt-text-caption">Hand poured soy candle no. {i} &amp; friends</h3>
+    <span class="currency-value">{price}</span>
+  </a>
+</li>"""
+
+
+def make_shop_page(num_listings: int, num_sales: int = 12345) -> str:
+    listings = "".join(
+        LISTING_TEMPLATE.format(i=i, price=f"{10 + i % 30}.00")
+        for i in range(num_listings)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>WicksByWerby</title>"
+        + "<script>window.Etsy = {};</script>" * 20
+        + "</head><body><header><div class='shop-info'>"
+        + f'<span class="wt-text-caption"><a href="{SOLD_HREF}">{num_sales:,} Sales</a></span>'
+        + f"</div></header><ul>{listings}</ul></body></html>"
+    )
+
+
+def make_cvs_status(state: str, num_cities: int) -> str:
+    cities = [
+        {
+            "city": f"CITY {i}",
+            "state": state,
+            "status": "Available" if i % 7 else "Fully Booked",
+        }
+        for i in range(num_cities)
+    ]
+    return json.dumps({"responsePayloadData": {"data": {state: cities}}})
+
+
+def make_video_events_asset(game_id: str, event_id: str) -> dict:
+    return {
+        "resultSets": {
+            "Meta": {
+                "videoUrls": [
+                    {
+                        "lurl": f"https://videos.nba.com/{game_id}/{event_id}_1280x720.mp4"
+                    }
+                ]
+            },
+            "playlist": [{"dsc": f"Play {event_id} of game {game_id}"}],
+        }
+    }
+
+
+class StubUpstreams:
+    """
+    Local aiohttp server standing in for etsy.com, cvs.com and stats.nba.com.
+
+    Set `shop_page` and `cvs_status` to what those pages should return, video
+    assets are generated from the query string.
+    """
+
+    def __init__(self):
+        self.shop_page = make_shop_page(10, 0)
+        self.cvs_status = make_cvs_status("MA", 10)
+        self.requests = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/shop", self._shop)
+        app.router.add_get("/cvs", self._cvs)
+        app.router.add_get("/stats/videoeventsasset", self._video_events_asset)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _shop(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.Response(text=self.shop_page, content_type="text/html")
+
+    async def _cvs(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.Response(text=self.cvs_status, content_type="application/json")
+
+    async def _video_events_asset(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.json_response(
+            make_video_events_asset(
+                request.query["GameID"], request.query["GameEventID"]
+            )
+        )
@@ -0,0 +1,116 @@
+import resource
+import time
+
+import discord
+from discord.ext import commands
+
+from calendar_service import close_calendar_service
+from concurrency import shutdown_executor
+from config import peachorobo_config
+from http_clients import http_clients
+from metrics import COMMAND_ERRORS, COMMAND_LATENCY, metrics
+
+intents = discord.Intents().default()
+intents.members = True
+
+
+def get_member_cache_options(lean: bool) -> dict:
+    """
+    Client options for the member cache. By default every member of every guild
+    is cached at startup, lean mode caches none and leaves it to scheduling to
+    chunk the one guild it needs.
+    """
+    if not lean:
+        return {}
+    return {
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+    }
+
+
+def get_peak_memory_mb() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _prefix_callable(_bot, _msg):
+    return peachorobo_config.bot_command_prefix
+
+
+class _PeachoroboBotMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started_at = time.perf_counter()
+        self._reported_ready = False
+        self.before_invoke(_record_command_start)
+        self.after_invoke(_record_command_latency)
+
+    async def start(self, *args, **kwargs):
+        await http_clients.start()
+        await super().start(*args, **kwargs)
+
+    async def on_ready(self):
+        # on_ready fires again after reconnects, only the first one is startup
+        if not self._reported_ready:
+            self._reported_ready = True
+            print(
+                f"Ready {time.perf_counter() - self.started_at:.2f}s after startup, "
+                f"peak memory {get_peak_memory_mb():.1f}MB"
+            )
+
+    async def close(self):
+        await close_calendar_service()
+        await http_clients.close()
+        shutdown_executor()
+        await super().close()
+
+
+async def _record_command_start(ctx: commands.Context) -> None:
+    ctx.started_at = time.perf_counter()
+
+
+async def _record_command_latency(ctx: commands.Context) -> None:
+    metrics.observe(
+        COMMAND_LATENCY,
+        time.perf_counter() - ctx.started_at,
+        command=ctx.command.qualified_name,
+        outcome="error" if ctx.command_failed else "ok",
+    )
+
+
+class PeachoroboBot(_PeachoroboBotMixin, commands.Bot):
+    pass
+
+
+class ShardedPeachoroboBot(_PeachoroboBotMixin, commands.AutoShardedBot):
+    """Lets discord pick the shard count, for serving many servers from one deployment"""
+
+
+def create_bot(sharded: bool = False, lean: bool = False) -> commands.Bot:
+    bot_class = ShardedPeachoroboBot if sharded else PeachoroboBot
+    return bot_class(
+        command_prefix=_prefix_callable,
+        intents=intents,
+        **get_member_cache_options(lean),
+    )
+
+
+async def on_command_error(ctx, error):
+    command = ctx.command.qualified_name if ctx.command is not None else "unknown"
+    metrics.increment(COMMAND_ERRORS, command=command, error=type(error).__name__)
+    await ctx.channel.send(error)
+
+
+async def send_to_debug_channel(bot: commands.Bot, message: str) -> None:
+    await bot.wait_until_ready()
+    channel = bot.get_channel(peachorobo_config.debug_channel_id)
+    if channel is not None:
+        await channel.send(message)
+
+
+def check_if_mystery_dinner_channel(ctx):
+    if ctx.channel.id not in peachorobo_config.channel_ids:
+        raise commands.CheckFailure(
+            message="Can only be used in a Mystery Dinner channel"
+        )
+    return True
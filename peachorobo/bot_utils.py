@@ -1,45 +1,196 @@
-import copy
-import random
-from datetime import datetime
-from typing import List, Optional
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
+import aiohttp
 import discord
 from discord.ext import commands
 
-from calendar_service import CalendarService
+from calendar_service import get_calendar_service, get_hangout_link
+from concurrency import run_blocking
 from constants import (
     MYSTERY_DINNER_CONFIRMATION_EMOJI,
     MYSTERY_DINNER_PICTURE_URI,
+    MysteryDinner,
     MysteryDinnerPairing,
     MysteryDinnerCalendar,
+    SerializedJob,
 )
-from db import DBService
+from config import peachorobo_config
+from db import DBService, DinnerPartition
+from pairing import PairingCosts, PairingError, make_cycle
+from scheduler import scheduler
+from user_resolver import LazyUser, resolve_users
+from utils import get_pretty_datetime
 
+JOB_DINNER_REMINDER = "dinner_reminder"
+JOB_DINNER_STARTING = "dinner_starting"
+REMINDER_LEAD_TIME = timedelta(hours=1)
 
-def make_pairings(members: List[discord.User]) -> List[MysteryDinnerPairing]:
-    temp_members = copy.copy(members)
-    pairings = []
-    random.shuffle(temp_members)
-    for i in range(len(temp_members)):
-        match = temp_members[i + 1] if i + 1 < len(temp_members) else temp_members[0]
-        pairing = MysteryDinnerPairing(user=temp_members[i], matched_with=match)
-        pairings.append(pairing)
-    return pairings
+
+def make_pairings(
+    members: List[discord.User],
+    past_pairings: Sequence[Iterable[Tuple[int, int]]] = (),
+    exclusions: Iterable[Tuple[int, int]] = (),
+) -> List[MysteryDinnerPairing]:
+    """
+    Pair members into a single cycle, avoiding recent repeats of past dinners'
+    (giver id, recipient id) pairs, newest dinner first, and never matching
+    excluded pairs.
+    """
+    members_by_id = {member.id: member for member in members}
+    order = make_cycle(list(members_by_id), PairingCosts(past_pairings, exclusions))
+    return [
+        MysteryDinnerPairing(
+            user=members_by_id[giver_id],
+            matched_with=members_by_id[order[(position + 1) % len(order)]],
+        )
+        for position, giver_id in enumerate(order)
+    ]
+
+
+# DMs in flight at once when sending out pairings. discord.py queues requests
+# per rate limit bucket, this keeps a large dinner from flooding that queue
+DM_FANOUT_CONCURRENCY = 5
+DM_SEND_ATTEMPTS = 3
+DM_RETRY_BACKOFF_SECONDS = 2.0
+
+
+@dataclass
+class DeliveryReport:
+    delivered: List[discord.User] = field(default_factory=list)
+    undeliverable: List[discord.User] = field(default_factory=list)
+
+
+def _is_transient_send_error(error: Exception) -> bool:
+    if isinstance(error, discord.HTTPException):
+        # 429s that discord.py gave up retrying and discord side errors
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError))
+
+
+def _get_retry_after(error: Exception, attempt: int) -> float:
+    if isinstance(error, discord.HTTPException) and error.response is not None:
+        retry_after = error.response.headers.get("Retry-After")
+        if retry_after is not None:
+            return float(retry_after)
+    return DM_RETRY_BACKOFF_SECONDS * 2 ** attempt
+
+
+async def _send_with_retry(user: discord.User, content: str) -> None:
+    for attempt in range(DM_SEND_ATTEMPTS):
+        try:
+            await user.send(content)
+            return
+        except Exception as e:
+            if attempt == DM_SEND_ATTEMPTS - 1 or not _is_transient_send_error(e):
+                raise
+            await asyncio.sleep(_get_retry_after(e, attempt))
+
+
+async def send_dms(messages: List[Tuple[discord.User, str]]) -> DeliveryReport:
+    """
+    DM each user their message, a few at a time and retrying transient errors.
+    Users read back from the DB are all resolved in one pass before sending.
+    """
+    await resolve_users(user for user, _ in messages if isinstance(user, LazyUser))
+    semaphore = asyncio.Semaphore(DM_FANOUT_CONCURRENCY)
+
+    async def send(user: discord.User, content: str) -> None:
+        async with semaphore:
+            await _send_with_retry(user, content)
+
+    results = await asyncio.gather(
+        *(send(user, content) for user, content in messages), return_exceptions=True
+    )
+    report = DeliveryReport()
+    for (user, _), result in zip(messages, results):
+        if isinstance(result, BaseException):
+            print(f"Could not send DM to {user}: {result}")
+            report.undeliverable.append(user)
+        else:
+            report.delivered.append(user)
+    return report
 
 
 async def send_pairings_out(
     pairings: List[MysteryDinnerPairing],
     mystery_dinner_time: str,
     event_uri: Optional[str],
+) -> DeliveryReport:
+    return await send_dms(
+        [
+            (
+                pairing.user,
+                f"Hi {pairing.user.display_name}, you're getting dinner for "
+                f"{pairing.matched_with.display_name}. The hangout link is {event_uri}. "
+                f"This is happening {mystery_dinner_time}. Use !help to see how to send anonymous messages",
+            )
+            for pairing in pairings
+        ]
+    )
+
+
+def make_reminder_jobs(
+    dinner_id: int, pairings: List[MysteryDinnerPairing], scheduled_time: datetime
+) -> List[SerializedJob]:
+    """A reminder an hour before and one when it starts for every giver, skipping ones already past"""
+    now = datetime.now(scheduled_time.tzinfo)
+    return [
+        {
+            "id": 0,
+            "kind": kind,
+            "due_iso": due_time.isoformat(),
+            "dinner_id": dinner_id,
+            "user_id": pairing.user.id,
+        }
+        for kind, due_time in (
+            (JOB_DINNER_REMINDER, scheduled_time - REMINDER_LEAD_TIME),
+            (JOB_DINNER_STARTING, scheduled_time),
+        )
+        if due_time > now
+        for pairing in pairings
+    ]
+
+
+def _get_reminder_content(kind: str, dinner: MysteryDinner, recipient_name: str) -> str:
+    if kind == JOB_DINNER_REMINDER:
+        return (
+            f"Reminder: the mystery dinner is {get_pretty_datetime(dinner.time)}, an hour from now. "
+            f"You're getting dinner for {recipient_name}. "
+            f"The hangout link is {dinner.calendar.get('uri')}"
+        )
+    return (
+        f"The mystery dinner is starting! You're getting dinner for "
+        f"{recipient_name}. The hangout link is {dinner.calendar.get('uri')}"
+    )
+
+
+async def send_dinner_reminders(
+    bot: commands.Bot, partition: DinnerPartition, jobs: List[SerializedJob]
 ) -> None:
-    for pairing in pairings:
-        giver = pairing.user
-        recipient = pairing.matched_with
-        await giver.send(
-            f"Hi {giver.display_name}, you're getting dinner for {recipient.display_name}. "
-            f"The hangout link is {event_uri}. "
-            f"This is happening {mystery_dinner_time}. Use !help to see how to send anonymous messages"
+    """Send the reminder of every job, each dinner involved is only looked up once"""
+    dinners: Dict[int, Optional[MysteryDinner]] = {}
+    messages = []
+    for job in jobs:
+        if job["dinner_id"] not in dinners:
+            dinners[job["dinner_id"]] = DBService.get_mystery_dinner(
+                partition, bot, job["dinner_id"]
+            )
+        dinner = dinners[job["dinner_id"]]
+        pairing = dinner.get_pairing_for_giver(job["user_id"]) if dinner else None
+        if dinner is None or pairing is None:
+            continue
+        messages.append(
+            (
+                pairing.user,
+                _get_reminder_content(
+                    job["kind"], dinner, pairing.matched_with.display_name
+                ),
+            )
         )
+    await send_dms(messages)
 
 
 async def send_invitation(ctx: commands.Context, mystery_dinner_time: str) -> None:
@@ -53,24 +204,55 @@ async def send_invitation(ctx: commands.Context, mystery_dinner_time: str) -> No
 async def handle_invite_confirmed(
     ctx: commands.Context, mystery_dinner_time: str, datetime_obj: datetime
 ) -> None:
-    members = [member for member in ctx.channel.members if not member.bot]
-    pairings = make_pairings(members)
-    calendar_service = CalendarService()
-    event = calendar_service.create_event(datetime_obj)
-    try:
-        event_uri = event.conference_solution.entry_points[0].uri
-    except Exception as e:
-        event_uri = None
-
-    calendar_data: MysteryDinnerCalendar = {"id": event.id, "uri": event_uri}
-    DBService.create_mystery_dinner(pairings, datetime_obj, calendar_data)
-    await send_pairings_out(pairings, mystery_dinner_time, event_uri)
+    partition = DinnerPartition.from_channel(ctx.channel)
+    guild = ctx.channel.guild
+    # with --lean no members are cached until now, and joins since the last chunk aren't either
+    if not guild.chunked:
+        await guild.chunk()
+    members = [
+        member
+        for member in ctx.channel.members
+        if not member.bot and member.id not in peachorobo_config.pairing_opt_outs
+    ]
+    async with DBService.get_lock(partition):
+        try:
+            # the local search can take up to a second, keep it off the event loop
+            pairings = await run_blocking(
+                make_pairings,
+                members,
+                DBService.get_recent_pairings(
+                    partition, peachorobo_config.pairing_history_depth
+                ),
+                peachorobo_config.pairing_exclusions,
+            )
+        except PairingError as e:
+            raise commands.CommandError(str(e))
+        event = await get_calendar_service().create_event(datetime_obj)
+        event_uri = get_hangout_link(event)
+
+        calendar_data: MysteryDinnerCalendar = {"id": event.id, "uri": event_uri}
+        dinner_id = DBService.create_mystery_dinner(
+            partition, pairings, datetime_obj, calendar_data
+        )
+        scheduler.schedule(
+            partition, make_reminder_jobs(dinner_id, pairings, datetime_obj)
+        )
+    report = await send_pairings_out(pairings, mystery_dinner_time, event_uri)
 
     mystery_dinner_embed = discord.Embed.from_dict(
         {"image": {"url": MYSTERY_DINNER_PICTURE_URI}}
     )
+    if report.undeliverable:
+        undeliverable_names = ", ".join(
+            user.display_name for user in report.undeliverable
+        )
+        summary = (
+            f"That's it folks, but I couldn't DM {undeliverable_names}. Make sure you accept DMs "
+            f"from server members and use !remindme to get your pairing. The hangout link is {event_uri}."
+        )
+    else:
+        summary = f"That's it folks, all the pairings have been sent out. The hangout link is {event_uri}."
     await ctx.channel.send(
-        content=f"That's it folks, all the pairings have been sent out. The hangout link is {event_uri}."
-        f" Enjoy your meal!",
+        content=f"{summary} Enjoy your meal!",
         embed=mystery_dinner_embed,
     )
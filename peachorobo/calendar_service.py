@@ -1,23 +1,111 @@
+import asyncio
+import pickle
+from concurrent.futures.thread import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from time import sleep
-
-import parsedatetime
-from gcsa.conference import ConferenceSolutionCreateRequest, SolutionType
-from gcsa.event import Event
-from gcsa.google_calendar import GoogleCalendar, SendUpdatesMode
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
 from pytz import timezone
 
 from config import peachorobo_config
+from resilience import RetryPolicy, call_with_retry
+
+# gcsa pulls in the whole google api client, only import it once a calendar is used
+if TYPE_CHECKING:
+    from gcsa.event import Event
+    from gcsa.google_calendar import GoogleCalendar
+
+# Meet links are attached asynchronously by Google after the event is created
+CONFERENCE_POLL_ATTEMPTS = 5
+CONFERENCE_POLL_INITIAL_DELAY_SECONDS = 1.0
+CONFERENCE_POLL_MAX_DELAY_SECONDS = 8.0
+
+CREDENTIALS_PATH = "credentials.json"
+TOKEN_PATH = "token.pickle"
+# refresh the oauth token this long before it expires so commands never wait on it
+TOKEN_REFRESH_MARGIN = timedelta(minutes=10)
+TOKEN_REFRESH_INTERVAL_SECONDS = 5 * 60
+CALENDAR_UPSTREAM = "google_calendar"
+CALENDAR_RETRY_POLICY = RetryPolicy(
+    attempts=3, initial_delay=1.0, max_delay=5.0, deadline=20.0
+)
+# creating an event isn't idempotent, a retry after a lost response would invite
+# everyone twice, so it only goes through the circuit breaker
+CALENDAR_CREATE_POLICY = RetryPolicy(attempts=1, initial_delay=0, max_delay=0)
+
+
+def get_hangout_link(event: "Event") -> Optional[str]:
+    try:
+        return event.conference_solution.entry_points[0].uri
+    except (AttributeError, IndexError, TypeError):
+        return None
 
 
 class CalendarService:
+    """
+    Long lived Google Calendar client, use get_calendar_service() to get the shared instance.
+
+    gcsa and the google api client are blocking so every call runs on a single
+    dedicated thread. One thread also serializes access to the client's httplib2
+    transport, which isn't thread safe, and keeps its connection alive between
+    commands. The oauth token is refreshed in the background before it expires.
+    """
+
     def __init__(self):
-        self.calendar = GoogleCalendar(
-            "primary", credentials_path="credentials.json", token_path="token.pickle"
+        self._calendar: Optional["GoogleCalendar"] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="calendar"
         )
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _get_calendar(self) -> "GoogleCalendar":
+        # reads credentials and builds the discovery client, so only call from the executor
+        if self._calendar is None:
+            from gcsa.google_calendar import GoogleCalendar
+
+            self._calendar = GoogleCalendar(
+                "primary",
+                credentials_path=CREDENTIALS_PATH,
+                token_path=TOKEN_PATH,
+            )
+        return self._calendar
+
+    async def _run(
+        self,
+        func: Callable[["GoogleCalendar"], Any],
+        policy: RetryPolicy = CALENDAR_RETRY_POLICY,
+    ) -> Any:
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self._keep_token_fresh())
+        loop = asyncio.get_event_loop()
+        return await call_with_retry(
+            CALENDAR_UPSTREAM,
+            lambda: loop.run_in_executor(
+                self._executor, lambda: func(self._get_calendar())
+            ),
+            policy,
+        )
+
+    async def _keep_token_fresh(self) -> None:
+        while True:
+            try:
+                await self._run(_refresh_token_if_expiring)
+            except asyncio.CancelledError:
+                # an Exception before python 3.8, close() has to be able to stop this
+                raise
+            except Exception as e:
+                print(f"Error refreshing calendar token: {type(e)} {e}")
+            await asyncio.sleep(TOKEN_REFRESH_INTERVAL_SECONDS)
+
+    async def close(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def create_event(self, start_dt: datetime) -> "Event":
+        from gcsa.conference import ConferenceSolutionCreateRequest, SolutionType
+        from gcsa.event import Event
+        from gcsa.google_calendar import SendUpdatesMode
 
-    def create_event(self, start_dt: datetime) -> Event:
         end_dt = start_dt + timedelta(hours=2)
         attendees = peachorobo_config.calendar_emails
         event = Event(
@@ -29,41 +117,81 @@ class CalendarService:
                 solution_type=SolutionType.HANGOUTS_MEET,
             ),
         )
-        event_response = self.calendar.add_event(
-            event, send_updates=SendUpdatesMode.ALL
+        event_response = await self._run(
+            lambda calendar: calendar.add_event(
+                event, send_updates=SendUpdatesMode.ALL
+            ),
+            CALENDAR_CREATE_POLICY,
         )
-        hangout_link = None
-        retries = 5
-        while hangout_link is None and retries > 0:
-            try:
-                hangout_link = event_response.conference_solution.entry_points[0].uri
-            except Exception as e:
-                event = self.get_event(event.id)
-                retries -= 1
-                sleep(5)
+        delay = CONFERENCE_POLL_INITIAL_DELAY_SECONDS
+        for _ in range(CONFERENCE_POLL_ATTEMPTS):
+            if get_hangout_link(event_response) is not None:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, CONFERENCE_POLL_MAX_DELAY_SECONDS)
+            event_response = await self.get_event(event_response.id)
         return event_response
 
-    def get_event(self, event_id: str) -> Event:
-        event_response = self.calendar.get_event(event_id)
-        return event_response
+    async def get_event(self, event_id: str) -> "Event":
+        return await self._run(lambda calendar: calendar.get_event(event_id))
+
+    async def delete_event(self, event_id: str) -> None:
+        def delete(calendar: "GoogleCalendar") -> None:
+            event = calendar.get_event(event_id)
+            calendar.delete_event(event)
 
-    def delete_event(self, event_id: str) -> None:
         try:
-            event = self.calendar.get_event(event_id)
-            self.calendar.delete_event(event)
+            await self._run(delete)
         except Exception:
             pass
 
 
-def main():
-    calendar_service = CalendarService()
+def _refresh_token_if_expiring(calendar: "GoogleCalendar") -> None:
+    from google.auth.transport.requests import Request
+
+    credentials = calendar.credentials
+    # google-auth keeps expiry as a naive utc datetime
+    if (
+        credentials.expiry is not None
+        and credentials.expiry - datetime.utcnow() > TOKEN_REFRESH_MARGIN
+    ):
+        return
+    credentials.refresh(Request())
+    with open(TOKEN_PATH, "wb") as f:
+        pickle.dump(credentials, f)
+
+
+_calendar_service: Optional[CalendarService] = None
+
+
+def get_calendar_service() -> CalendarService:
+    global _calendar_service
+    if _calendar_service is None:
+        _calendar_service = CalendarService()
+    return _calendar_service
+
+
+async def close_calendar_service() -> None:
+    global _calendar_service
+    if _calendar_service is not None:
+        await _calendar_service.close()
+        _calendar_service = None
+
+
+async def main():
+    import parsedatetime
+
+    calendar_service = get_calendar_service()
     cal_parser = parsedatetime.Calendar()
     start_dt, _ = cal_parser.parseDT(
         datetimeString="tomorrow at 3pm", tzinfo=timezone("US/Eastern")
     )
-    event = calendar_service.create_event(start_dt)
-    event
+    event = await calendar_service.create_event(start_dt)
+    print(get_hangout_link(event))
+    await close_calendar_service()
 
 
 if __name__ == "__main__":
-    main()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main())
+    loop.close()
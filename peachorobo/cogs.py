@@ -1,54 +1,37 @@
-import asyncio
-from concurrent.futures.thread import ThreadPoolExecutor
-from time import sleep
+import functools
 
 import discord
-from discord.ext import commands, tasks
-
-from bot_utils import send_invitation, handle_invite_confirmed
-from calendar_service import CalendarService
+from discord.ext import commands
+
+from bot import on_command_error, check_if_mystery_dinner_channel
+from bot_utils import (
+    JOB_DINNER_REMINDER,
+    JOB_DINNER_STARTING,
+    send_dinner_reminders,
+    send_invitation,
+    handle_invite_confirmed,
+)
+from calendar_service import get_calendar_service
 from constants import (
     MYSTERY_DINNER_CONFIRMATION_EMOJI,
     MYSTERY_DINNER_CANCEL_EMOJI,
-    NBA_CONFIRMATION_EMOJI,
 )
 from config import peachorobo_config
-from db import DBService
-from nba import (
-    get_most_recent_game_with_retry,
-    get_team_id,
-    get_player_id,
-    get_video_data_with_retry,
-    HighlightData,
-)
-from wack_utils import (
-    get_live_num_sales,
-    get_internal_num_sales,
-    wack_has_been_run,
-)
+from db import DBService, DinnerPartition
+from scheduler import scheduler
 from utils import parse_raw_datetime, get_pretty_datetime
 
-intents = discord.Intents().default()
-intents.members = True
-
-
-def _prefix_callable(_bot, _msg):
-    return peachorobo_config.bot_command_prefix
-
-
-bot = commands.Bot(command_prefix=_prefix_callable, intents=intents)
-
-
-async def on_command_error(ctx, error):
-    await ctx.channel.send(error)
-
 
-def check_if_mystery_dinner_channel(ctx):
-    if ctx.channel.id != peachorobo_config.channel_id:
-        raise commands.CheckFailure(
-            message="Can only be used in the Mystery Dinner channel"
-        )
-    return True
+def _get_next_dinner(bot, ctx: commands.Context):
+    if ctx.channel.type == discord.ChannelType.private:
+        # DMs aren't tied to a channel, use whichever dinner the author is part of
+        return DBService.get_latest_mystery_dinner_for_user(bot, ctx.author.id)
+    # cog checks run before the channel check, don't create a store for every channel
+    if ctx.channel.id not in peachorobo_config.channel_ids:
+        return None
+    return DBService.get_latest_mystery_dinner(
+        DinnerPartition.from_channel(ctx.channel), bot
+    )
 
 
 class PreDinner(commands.Cog):
@@ -89,19 +72,12 @@ class PreDinner(commands.Cog):
         commands.dm_only(), commands.check(check_if_mystery_dinner_channel)
     )
     async def remindme(self, ctx):
-        next_dinner = DBService.get_latest_mystery_dinner(self.bot)
+        is_dm = ctx.channel.type == discord.ChannelType.private
+        next_dinner = _get_next_dinner(self.bot, ctx)
         if not next_dinner:
             raise commands.CommandError("No upcoming dinner")
-        is_dm = ctx.channel.type == discord.ChannelType.private
         if is_dm:
-            pairing = next(
-                (
-                    pairing
-                    for pairing in next_dinner.pairings
-                    if pairing.user.id == ctx.author.id
-                ),
-                None,
-            )
+            pairing = next_dinner.get_pairing_for_giver(ctx.author.id)
             if not pairing:
                 raise commands.CommandError("No pairing found")
             recipient = pairing.matched_with
@@ -122,25 +98,24 @@ class PostDinner(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.next_dinner = None
 
     async def cog_command_error(self, ctx, error):
         await on_command_error(ctx, error)
 
-    async def cog_check(self, _ctx):
-        next_dinner = DBService.get_latest_mystery_dinner(self.bot)
-        self.next_dinner = next_dinner
-        if not self.next_dinner:
+    async def cog_check(self, ctx):
+        # kept on the context, commands in other channels run concurrently
+        ctx.next_dinner = _get_next_dinner(self.bot, ctx)
+        if not ctx.next_dinner:
             raise commands.CommandError(message="No upcoming dinners found")
         return True
 
     @commands.command(help="Cancels the next mystery dinner")
     @commands.check(check_if_mystery_dinner_channel)
     async def cancel(self, ctx):
-        assert self.next_dinner is not None
+        next_dinner = ctx.next_dinner
         cancel_message = await ctx.channel.send(
-            content=f"Are you sure you want to cancel the next dinner with id {self.next_dinner.id} on "
-            f"{get_pretty_datetime(self.next_dinner.time)}. "
+            content=f"Are you sure you want to cancel the next dinner with id {next_dinner.id} on "
+            f"{get_pretty_datetime(next_dinner.time)}. "
             f"React with {MYSTERY_DINNER_CANCEL_EMOJI} to confirm."
         )
         await cancel_message.add_reaction(MYSTERY_DINNER_CANCEL_EMOJI)
@@ -152,12 +127,19 @@ class PostDinner(commands.Cog):
             )
 
         await self.bot.wait_for("reaction_add", timeout=60.0, check=is_confirmed)
-        event_id = self.next_dinner.calendar.get("id")
-        calendar_service = CalendarService()
-        calendar_service.delete_event(event_id)
-        DBService.cancel_latest_mystery_dinner()
+        partition = DinnerPartition.from_channel(ctx.channel)
+        async with DBService.get_lock(partition):
+            latest_dinner = DBService.get_latest_mystery_dinner(partition, self.bot)
+            if latest_dinner is None or latest_dinner.id != next_dinner.id:
+                raise commands.CommandError(
+                    "The next dinner changed while waiting for confirmation, nothing was cancelled"
+                )
+            event_id = next_dinner.calendar.get("id")
+            await get_calendar_service().delete_event(event_id)
+            DBService.cancel_latest_mystery_dinner(partition)
+            scheduler.cancel_dinner(partition, next_dinner.id)
         await ctx.channel.send(
-            f"The next dinner with id {self.next_dinner.id} on {get_pretty_datetime(self.next_dinner.time)} "
+            f"The next dinner with id {next_dinner.id} on {get_pretty_datetime(next_dinner.time)} "
             f"was cancelled @everyone"
         )
 
@@ -167,16 +149,8 @@ class PostDinner(commands.Cog):
     )
     @commands.dm_only()
     async def yourfoodshere(self, ctx, *, message: str):
-        assert self.next_dinner is not None
         author = ctx.author
-        pairing = next(
-            (
-                pairing
-                for pairing in self.next_dinner.pairings
-                if pairing.user.id == author.id
-            ),
-            None,
-        )
+        pairing = ctx.next_dinner.get_pairing_for_giver(author.id)
         if not pairing:
             raise commands.CommandError("No pairing found")
         matched_with_user = pairing.matched_with
@@ -191,16 +165,8 @@ class PostDinner(commands.Cog):
     )
     @commands.dm_only()
     async def wheresmyfood(self, ctx, *, message: str):
-        assert self.next_dinner is not None
         author = ctx.author
-        pairing = next(
-            (
-                pairing
-                for pairing in self.next_dinner.pairings
-                if pairing.matched_with.id == author.id
-            ),
-            None,
-        )
+        pairing = ctx.next_dinner.get_pairing_for_recipient(author.id)
         if not pairing:
             raise commands.CommandError("No pairing found")
         gifter = pairing.user
@@ -208,129 +174,27 @@ class PostDinner(commands.Cog):
         await ctx.author.send(f"Message successfully sent to your gifter")
 
 
-class WackWatch(commands.Cog):
-    """utility to monitor wack logs"""
+class Reminders(commands.Cog):
+    """DMs everyone an hour before their mystery dinner and when it starts"""
 
     def __init__(self, bot):
         self.bot = bot
-        self.watch.start()
-        # want to only send each alert once. need some kind of hash to tell us if we've sent that kind of alert before
-        # and avoid sending it again
-        self.messages_key = None
+        send_reminder = functools.partial(send_dinner_reminders, bot)
+        scheduler.register(JOB_DINNER_REMINDER, send_reminder)
+        scheduler.register(JOB_DINNER_STARTING, send_reminder)
+        self._start = self.bot.loop.create_task(self.start_scheduler())
 
     def cog_unload(self):
-        self.watch.cancel()
-
-    @commands.command(
-        help="Manually run wack watch",
-    )
-    async def wackwatch(self, ctx):
-        await ctx.send("Manually running wack watch")
-        await self.watch(ctx=ctx, verbose=True)
-        await ctx.send(f"Finished wack watch")
+        self._start.cancel()
+        scheduler.stop()
 
-    @tasks.loop(minutes=5.0)
-    async def watch(self, ctx=None, verbose=False) -> None:
-        messages = []
-        channel = (
-            ctx
-            if ctx is not None
-            else self.bot.get_channel(peachorobo_config.debug_channel_id)
-        )
-        try:
-            did_run = wack_has_been_run()
-            if did_run and verbose:
-                messages.append("Wack ran in last 5 minutes")
-            elif not did_run:
-                messages.append("Wack has not run for more than 5 minutes. ERROR")
-            retries = 12
-            live_num_sales = await get_live_num_sales()
-            while True:
-                internal_num_sales = get_internal_num_sales()
-                if live_num_sales != internal_num_sales:
-                    if retries > 0:
-                        retries -= 1
-                        sleep(10)
-                        continue
-                    messages.append(
-                        f"Wack error! {internal_num_sales} sales in Wack vs {live_num_sales} sales on etsy.com"
-                    )
-                    break
-                else:
-                    if verbose:
-                        messages.append(
-                            f"Number of sales in Wack ({internal_num_sales}) matches number of sales on etsy.com ({live_num_sales})"
-                        )
-                    break
-        except Exception as e:
-            messages.append(f"Error looking up last wack run: {e}")
-        new_messages_key = hash(tuple(messages))
-        if new_messages_key != self.messages_key:
-            self.messages_key = new_messages_key
-            for message in messages:
-                await channel.send(message)
-
-    @watch.before_loop
-    async def before_watch(self):
+    async def start_scheduler(self) -> None:
+        # channels, and so the partitions with jobs to load, are only known once connected
         await self.bot.wait_until_ready()
+        scheduler.start(DBService.get_configured_partitions(self.bot))
 
 
-class NBAHighlights(commands.Cog):
-    """Get uri for nba highlights"""
-
-    def __init__(self, bot):
-        self.bot = bot
-
-    @commands.command(
-        help="Get highlights from the most recent NBA game",
-        usage="DEN Nikola Jokic",
-    )
-    async def highlights(self, ctx, team_abbreviation: str, *, player_name: str):
-        try:
-            team_id = get_team_id(team_abbreviation.upper())
-        except Exception as e:
-            await ctx.send(f"Error getting team {e}")
-            return
-        try:
-            player_id = get_player_id(player_name.title())
-        except Exception as e:
-            await ctx.send(f"Error getting player {e}")
-            return
-
-        await ctx.send(
-            f"Getting the msot recent game {player_name} on {team_abbreviation}, please be patient..."
-        )
-        loop = asyncio.get_event_loop()
-        most_recent_game_data = await loop.run_in_executor(
-            ThreadPoolExecutor(), get_most_recent_game_with_retry, team_id, player_id
-        )
-        if most_recent_game_data is None:
-            await ctx.send(
-                f"Sorry, couldn't get the most recent game for {player_name}"
-            )
-            return
-
-        game_description = (
-            f"{most_recent_game_data.home_team} vs {most_recent_game_data.away_team} on "
-            f"{most_recent_game_data.game_date.strftime('%A')} {most_recent_game_data.game_date}"
-        )
-        game_message = await ctx.send(
-            f"Found a game: {game_description}. Show {len(most_recent_game_data.plays)} highlights now?"
-        )
-        await game_message.add_reaction(NBA_CONFIRMATION_EMOJI)
-
-        def is_confirmed(reaction, user):
-            return user == ctx.author and str(reaction.emoji) == NBA_CONFIRMATION_EMOJI
-
-        await self.bot.wait_for("reaction_add", timeout=60.0, check=is_confirmed)
-
-        for play_data in most_recent_game_data.plays:
-            video_data = await get_video_data_with_retry(
-                HighlightData(
-                    game_id=most_recent_game_data.game_id, event_id=play_data.event_id
-                )
-            )
-            if video_data is None:
-                continue
-            else:
-                await ctx.send(f"{video_data.description}\n{video_data.uri}")
+def setup(bot):
+    bot.add_cog(PreDinner(bot))
+    bot.add_cog(PostDinner(bot))
+    bot.add_cog(Reminders(bot))
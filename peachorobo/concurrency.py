@@ -0,0 +1,63 @@
+import asyncio
+import functools
+from concurrent.futures.thread import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# threads for blocking library calls (nba_api, page parsing) shared by the whole bot
+BLOCKING_EXECUTOR_MAX_WORKERS = 4
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=BLOCKING_EXECUTOR_MAX_WORKERS,
+            thread_name_prefix="peachorobo-blocking",
+        )
+    return _executor
+
+
+async def run_blocking(func: Callable[..., T], *args) -> T:
+    """Run a blocking function on the shared executor without holding up the event loop"""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args))
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+class SingleFlight(Generic[T]):
+    """
+    Collapses concurrent calls for the same key into one.
+
+    While a call for a key is in flight, later callers await the same result
+    instead of starting their own. A caller being cancelled doesn't cancel the
+    shared call for everyone else.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._forget(key, future))
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+
+    def cancel_all(self) -> None:
+        for future in self._in_flight.values():
+            future.cancel()
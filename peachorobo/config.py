@@ -1,6 +1,6 @@
 import os
 from dataclasses import dataclass, field
-from typing import List
+from typing import List, Tuple
 
 from dotenv import load_dotenv
 
@@ -8,26 +8,77 @@ from dotenv import load_dotenv
 @dataclass
 class PeachoroboConfig:
     channel_id: int = 0
+    channel_ids: List[int] = field(default_factory=list)
     debug_channel_id: int = 0
     discord_bot_token: str = ""
     calendar_emails: List[str] = field(default_factory=list)
     db_json_path: str = ""
+    db_backend: str = "journal"
+    db_sqlite_path: str = ""
     is_prod: bool = False
     bot_command_prefix = ""
     wack_last_success_ts_path: str = ""
     wack_num_sales_path: str = ""
+    http_cache_path: str = "http_cache.json"
+    nba_cache_path: str = "nba_cache.sqlite3"
+    wack_retry_attempts: int = 8
+    wack_retry_initial_delay_seconds: float = 5.0
+    wack_retry_backoff_multiplier: float = 1.5
+    wack_retry_max_delay_seconds: float = 30.0
+    metrics_textfile_path: str = ""
+    pairing_exclusions: List[Tuple[int, int]] = field(default_factory=list)
+    pairing_opt_outs: List[int] = field(default_factory=list)
+    pairing_history_depth: int = 10
 
     def load(self, is_prod: bool) -> None:
         load_dotenv()
         self.is_prod = is_prod
-        self.channel_id = int(os.environ["DISCORD_MYSTERY_DINNER_CHANNEL_ID"])
+        self.channel_id = int(os.environ.get("DISCORD_MYSTERY_DINNER_CHANNEL_ID", 0))
+        self.channel_ids = [
+            int(channel_id)
+            for channel_id in os.environ.get(
+                "DISCORD_MYSTERY_DINNER_CHANNEL_IDS", ""
+            ).split(",")
+            if channel_id
+        ]
+        if self.channel_id and self.channel_id not in self.channel_ids:
+            self.channel_ids.append(self.channel_id)
         self.debug_channel_id = int(os.environ["DEBUG_CHANNEL_ID"])
         self.discord_bot_token = os.environ["DISCORD_TOKEN"]
         self.calendar_emails = os.environ["CALENDAR_EMAILS"].split(",")
         self.db_json_path = os.environ["DB_JSON_PATH"]
+        self.db_backend = os.environ.get("DB_BACKEND", "journal")
+        self.db_sqlite_path = os.environ.get("DB_SQLITE_PATH", "peachorobo.sqlite3")
         self.bot_command_prefix = "!" if is_prod else "?"
         self.wack_last_success_ts_path = os.environ["WACK_LAST_SUCCESS_TS_PATH"]
         self.wack_num_sales_path = os.environ["WACK_NUM_SALES_PATH"]
+        self.http_cache_path = os.environ.get("HTTP_CACHE_PATH", "http_cache.json")
+        self.nba_cache_path = os.environ.get("NBA_CACHE_PATH", "nba_cache.sqlite3")
+        self.wack_retry_attempts = int(os.environ.get("WACK_RETRY_ATTEMPTS", 8))
+        self.wack_retry_initial_delay_seconds = float(
+            os.environ.get("WACK_RETRY_INITIAL_DELAY_SECONDS", 5.0)
+        )
+        self.wack_retry_backoff_multiplier = float(
+            os.environ.get("WACK_RETRY_BACKOFF_MULTIPLIER", 1.5)
+        )
+        self.wack_retry_max_delay_seconds = float(
+            os.environ.get("WACK_RETRY_MAX_DELAY_SECONDS", 30.0)
+        )
+        self.metrics_textfile_path = os.environ.get("METRICS_TEXTFILE_PATH", "")
+        self.pairing_exclusions = [
+            (int(giver_id), int(recipient_id))
+            for giver_id, recipient_id in (
+                pair.split(":")
+                for pair in os.environ.get("PAIRING_EXCLUSIONS", "").split(",")
+                if pair
+            )
+        ]
+        self.pairing_opt_outs = [
+            int(user_id)
+            for user_id in os.environ.get("PAIRING_OPT_OUTS", "").split(",")
+            if user_id
+        ]
+        self.pairing_history_depth = int(os.environ.get("PAIRING_HISTORY_DEPTH", 10))
 
 
 peachorobo_config = PeachoroboConfig()
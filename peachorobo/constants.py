@@ -1,20 +1,45 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
 
 import discord
 from typing_extensions import TypedDict
 
+if TYPE_CHECKING:
+    from user_resolver import LazyUser
+
 MYSTERY_DINNER_PICTURE_URI = "https://i.imgur.com/4ZKWUVC.jpg"
 MYSTERY_DINNER_CONFIRMATION_EMOJI = "<:peach_hungry:819035345307566082>"
 MYSTERY_DINNER_CANCEL_EMOJI = "<:mayu_nya:819042520288722964>"
 NBA_CONFIRMATION_EMOJI = "<:jeffrey_hungry:823308637200056360>"
 
 
-@dataclass
 class MysteryDinnerPairing:
-    user: discord.User
-    matched_with: discord.User
+    # live users when pairing, LazyUsers when read back from the DB. Cached
+    # dinners keep one of these per member so it's slotted to stay small. The
+    # users are kept rather than their int ids: a dinner needs one user object
+    # per member for names and DMs anyway, shared between giver and recipient,
+    # so a slot pointing at it costs the same as one pointing at an int, and
+    # ids would only add a lookup to every caller
+    __slots__ = ("user", "matched_with")
+
+    def __init__(
+        self,
+        user: Union[discord.User, "LazyUser"],
+        matched_with: Union[discord.User, "LazyUser"],
+    ):
+        self.user = user
+        self.matched_with = matched_with
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, MysteryDinnerPairing)
+            and other.user == self.user
+            and other.matched_with == self.matched_with
+        )
+
+    def __repr__(self):
+        return f"MysteryDinnerPairing(user={self.user!r}, matched_with={self.matched_with!r})"
 
 
 class MysteryDinnerCalendar(TypedDict):
@@ -28,6 +53,26 @@ class MysteryDinner:
     id: int
     time: datetime
     calendar: MysteryDinnerCalendar
+    pairings_by_giver_id: Dict[int, MysteryDinnerPairing] = field(
+        init=False, repr=False, compare=False
+    )
+    pairings_by_recipient_id: Dict[int, MysteryDinnerPairing] = field(
+        init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        self.pairings_by_giver_id = {
+            pairing.user.id: pairing for pairing in self.pairings
+        }
+        self.pairings_by_recipient_id = {
+            pairing.matched_with.id: pairing for pairing in self.pairings
+        }
+
+    def get_pairing_for_giver(self, user_id: int) -> Optional[MysteryDinnerPairing]:
+        return self.pairings_by_giver_id.get(user_id)
+
+    def get_pairing_for_recipient(self, user_id: int) -> Optional[MysteryDinnerPairing]:
+        return self.pairings_by_recipient_id.get(user_id)
 
 
 class SerializedUser(TypedDict):
@@ -47,3 +92,12 @@ class SerializedMysteryDinner(TypedDict):
     pairings: List[SerializedPairing]
     id: int
     datetime_iso: str
+
+
+class SerializedJob(TypedDict):
+    id: int
+    kind: str
+    due_iso: str
+    # jobs go away with the dinner they belong to when it's cancelled
+    dinner_id: int
+    user_id: int
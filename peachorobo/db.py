@@ -1,9 +1,11 @@
-import json
+import asyncio
+import os
+from dataclasses import dataclass
 from datetime import datetime
-from json import JSONDecodeError
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import pytz
+
 from discord.ext import commands
 
 from constants import (
@@ -11,28 +13,128 @@ from constants import (
     MysteryDinner,
     SerializedMysteryDinner,
     MysteryDinnerCalendar,
+    SerializedJob,
 )
 from config import peachorobo_config
+from storage import DinnerStore, JournaledDinnerStore, SQLiteDinnerStore
 from utils import serialize_pairing, deserialize_mystery_dinner
 
+DB_BACKEND_JOURNAL = "journal"
+DB_BACKEND_SQLITE = "sqlite"
+
+
+@dataclass(frozen=True)
+class DinnerPartition:
+    """The guild channel a dinner is scheduled in, each one has its own storage"""
+
+    guild_id: int
+    channel_id: int
+
+    @classmethod
+    def from_channel(cls, channel) -> "DinnerPartition":
+        return cls(guild_id=channel.guild.id, channel_id=channel.id)
+
+
+def get_partition_path(path: str, partition: DinnerPartition) -> str:
+    # the original single channel keeps using the un-suffixed files it always had
+    if partition.channel_id == peachorobo_config.channel_id:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{partition.guild_id}.{partition.channel_id}{ext}"
+
+
+def _create_store(partition: DinnerPartition) -> DinnerStore:
+    backend = peachorobo_config.db_backend
+    json_path = get_partition_path(peachorobo_config.db_json_path, partition)
+    if backend == DB_BACKEND_JOURNAL:
+        return JournaledDinnerStore(json_path)
+    if backend == DB_BACKEND_SQLITE:
+        store = SQLiteDinnerStore(
+            get_partition_path(peachorobo_config.db_sqlite_path, partition)
+        )
+        # only ever once, a DB emptied by cancelling every dinner mustn't get them back
+        if not store.is_imported():
+            if store.is_empty() and peachorobo_config.db_json_path:
+                # first run on sqlite, carry over the history from the json DB
+                journal_store = JournaledDinnerStore(json_path)
+                for dinner in journal_store.get_all():
+                    store.import_dinner(dinner)
+                store.add_jobs(journal_store.get_jobs())
+            store.mark_imported()
+        return store
+    raise ValueError(f"Unknown DB backend {backend}")
+
+
+class _LatestDinnerCache:
+    """
+    Read-through cache of the deserialized latest dinner of one store.
 
-def _get_serialized_mystery_dinners() -> List[SerializedMysteryDinner]:
-    try:
-        with open(peachorobo_config.db_json_path, "r") as f:
-            serialized_dinners: List[SerializedMysteryDinner] = json.load(f)
-    except (JSONDecodeError, FileNotFoundError):
-        return []
-    return serialized_dinners
+    Entries are tagged with the store version they were built from, so the
+    store's own writes and reloads after external edits both invalidate it.
+    """
+
+    def __init__(self, store: DinnerStore):
+        self._store = store
+        self._dinner: Optional[MysteryDinner] = None
+        self._version = -1
+
+    def get(self, bot: commands.Bot) -> Optional[MysteryDinner]:
+        self._store.reload_if_changed()
+        if self._store.version == self._version:
+            return self._dinner
+        last_dinner = self._store.get_latest()
+        self._dinner = (
+            deserialize_mystery_dinner(last_dinner, bot) if last_dinner else None
+        )
+        self._version = self._store.version
+        return self._dinner
+
+
+class _PartitionState:
+    def __init__(self, partition: DinnerPartition):
+        self.store = _create_store(partition)
+        self.latest_dinner_cache = _LatestDinnerCache(self.store)
+        # held while scheduling or cancelling so two of them in the same channel don't interleave
+        self.lock = asyncio.Lock()
+
+
+_partitions: Dict[DinnerPartition, _PartitionState] = {}
+
+
+def _get_partition_state(partition: DinnerPartition) -> _PartitionState:
+    if partition not in _partitions:
+        _partitions[partition] = _PartitionState(partition)
+    return _partitions[partition]
+
+
+def _get_store(partition: DinnerPartition) -> DinnerStore:
+    store = _get_partition_state(partition).store
+    store.reload_if_changed()
+    return store
 
 
 class DBService:
+    @staticmethod
+    def get_configured_partitions(bot: commands.Bot) -> List[DinnerPartition]:
+        """Partitions of every configured mystery dinner channel the bot can see"""
+        partitions = []
+        for channel_id in peachorobo_config.channel_ids:
+            channel = bot.get_channel(channel_id)
+            if channel is not None and getattr(channel, "guild", None) is not None:
+                partitions.append(DinnerPartition.from_channel(channel))
+        return partitions
+
+    @staticmethod
+    def get_lock(partition: DinnerPartition) -> asyncio.Lock:
+        return _get_partition_state(partition).lock
+
     @staticmethod
     def create_mystery_dinner(
+        partition: DinnerPartition,
         pairings: List[MysteryDinnerPairing],
         scheduled_time: datetime,
         calendar: MysteryDinnerCalendar,
-    ) -> None:
-        dinners = _get_serialized_mystery_dinners()
+    ) -> int:
         serialized_pairings = [
             serialize_pairing(pairing.user, pairing.matched_with)
             for pairing in pairings
@@ -41,25 +143,87 @@ class DBService:
             "pairings": serialized_pairings,
             "calendar": calendar,
             "datetime_iso": scheduled_time.isoformat(),
-            "id": len(dinners) + 1,
+            "id": 0,
         }
-        dinners.append(serialized_dinner)
-        with open(peachorobo_config.db_json_path, "w") as f:
-            json.dump(dinners, f)
+        return _get_store(partition).create(serialized_dinner)["id"]
+
+    @staticmethod
+    def get_recent_pairings(
+        partition: DinnerPartition, limit: int
+    ) -> List[List[Tuple[int, int]]]:
+        """(giver id, recipient id) pairs of the `limit` most recent dinners, newest first"""
+        return [
+            [
+                (pairing["user"]["id"], pairing["matched_with"]["id"])
+                for pairing in dinner["pairings"]
+            ]
+            for dinner in _get_store(partition).get_recent(limit)
+        ]
+
+    @staticmethod
+    def get_latest_mystery_dinner(
+        partition: DinnerPartition, bot: commands.Bot
+    ) -> Optional[MysteryDinner]:
+        return _get_partition_state(partition).latest_dinner_cache.get(bot)
+
+    @staticmethod
+    def get_mystery_dinner(
+        partition: DinnerPartition, bot: commands.Bot, dinner_id: int
+    ) -> Optional[MysteryDinner]:
+        # usually it's the latest one, which is already deserialized
+        latest_dinner = DBService.get_latest_mystery_dinner(partition, bot)
+        if latest_dinner is not None and latest_dinner.id == dinner_id:
+            return latest_dinner
+        dinner = _get_store(partition).get(dinner_id)
+        return deserialize_mystery_dinner(dinner, bot) if dinner else None
+
+    @staticmethod
+    def get_latest_mystery_dinner_for_user(
+        bot: commands.Bot, user_id: int
+    ) -> Optional[MysteryDinner]:
+        """The latest dinner the user is in across every channel, for commands sent in DMs"""
+        dinners = []
+        for partition in DBService.get_configured_partitions(bot):
+            dinner = DBService.get_latest_mystery_dinner(partition, bot)
+            if dinner is not None and (
+                dinner.get_pairing_for_giver(user_id) is not None
+                or dinner.get_pairing_for_recipient(user_id) is not None
+            ):
+                dinners.append(dinner)
+        return max(dinners, key=lambda dinner: dinner.time, default=None)
+
+    @staticmethod
+    def cancel_latest_mystery_dinner(partition: DinnerPartition) -> None:
+        _get_store(partition).cancel_latest()
+
+    @staticmethod
+    def get_mystery_dinners_for_user(
+        partition: DinnerPartition, bot: commands.Bot, user_id: int
+    ) -> List[MysteryDinner]:
+        return [
+            deserialize_mystery_dinner(dinner, bot)
+            for dinner in _get_store(partition).get_dinners_for_user(user_id)
+        ]
+
+    @staticmethod
+    def get_upcoming_mystery_dinners(
+        partition: DinnerPartition, bot: commands.Bot
+    ) -> List[MysteryDinner]:
+        return [
+            deserialize_mystery_dinner(dinner, bot)
+            for dinner in _get_store(partition).get_upcoming(datetime.now(pytz.utc))
+        ]
+
+    @staticmethod
+    def add_jobs(
+        partition: DinnerPartition, jobs: List[SerializedJob]
+    ) -> List[SerializedJob]:
+        return _get_store(partition).add_jobs(jobs)
 
     @staticmethod
-    def get_latest_mystery_dinner(bot: commands.Bot) -> Optional[MysteryDinner]:
-        dinners = _get_serialized_mystery_dinners()
-        if not dinners:
-            return None
-        last_dinner = deserialize_mystery_dinner(dinners[-1], bot)
-        return last_dinner
+    def remove_jobs(partition: DinnerPartition, job_ids: List[int]) -> None:
+        _get_store(partition).remove_jobs(job_ids)
 
     @staticmethod
-    def cancel_latest_mystery_dinner() -> None:
-        dinners = _get_serialized_mystery_dinners()
-        if not dinners:
-            return
-        dinners = dinners[:-1]
-        with open(peachorobo_config.db_json_path, "w") as f:
-            json.dump(dinners, f)
+    def get_jobs(partition: DinnerPartition) -> List[SerializedJob]:
+        return _get_store(partition).get_jobs()
@@ -0,0 +1,100 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# caches stored in the same file share one connection and the lock guarding it
+_connections: Dict[str, sqlite3.Connection] = {}
+_locks: Dict[str, threading.Lock] = {}
+
+
+def _get_connection(path: str) -> sqlite3.Connection:
+    if path not in _connections:
+        connection = sqlite3.connect(path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        _connections[path] = connection
+        _locks[path] = threading.Lock()
+    return _connections[path]
+
+
+class DiskLRUCache:
+    """
+    Size bounded LRU cache of json values that persists across restarts.
+
+    Entries live in a SQLite table so lookups are indexed and survive a restart.
+    When the table holds more than `max_entries` the least recently read
+    entries are evicted. With a `ttl_seconds` entries also expire that long
+    after being written. Safe to use from executor threads.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: str,
+        max_entries: int,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._connection = _get_connection(path)
+        self._lock = _locks[path]
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {name}_accessed_at ON {name} (accessed_at)"
+            )
+            self._size = self._connection.execute(
+                f"SELECT COUNT(*) FROM {name}"
+            ).fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                f"SELECT value, expires_at FROM {self.name} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._connection.execute(
+                    f"DELETE FROM {self.name} WHERE key = ?", (key,)
+                )
+                self._size -= 1
+                return None
+            self._connection.execute(
+                f"UPDATE {self.name} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds is not None else None
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                f"UPDATE {self.name} SET value = ?, expires_at = ?, accessed_at = ? "
+                "WHERE key = ?",
+                (json.dumps(value), expires_at, now, key),
+            )
+            if cursor.rowcount:
+                return
+            self._connection.execute(
+                f"INSERT INTO {self.name} (key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now),
+            )
+            self._size += 1
+            if self._size > self.max_entries:
+                self._connection.execute(
+                    f"DELETE FROM {self.name} WHERE key IN (SELECT key FROM {self.name} "
+                    "ORDER BY accessed_at LIMIT ?)",
+                    (self._size - self.max_entries,),
+                )
+                self._size = self.max_entries
@@ -0,0 +1,128 @@
+import asyncio
+from typing import Dict
+
+from discord.ext import commands
+
+from constants import NBA_CONFIRMATION_EMOJI
+from nba import (
+    get_current_team_id_with_retry,
+    get_most_recent_game_with_retry,
+    iter_video_data,
+    GameData,
+)
+from nba_resolver import get_resolver
+
+# fuzzy player matches scoring lower than this get suggestions instead of a lookup
+PLAYER_MATCH_THRESHOLD = 0.6
+
+
+class NBAHighlights(commands.Cog):
+    """Get uri for nba highlights"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._highlights_tasks: Dict[int, asyncio.Task] = {}
+        # building the name indexes takes a moment, do it now rather than on the first command
+        get_resolver()
+
+    def cog_unload(self):
+        for task in self._highlights_tasks.values():
+            task.cancel()
+
+    @commands.command(
+        help="Get highlights from the most recent NBA game, the team is optional",
+        usage="DEN Nikola Jokic",
+    )
+    async def highlights(self, ctx, *, query: str):
+        resolver = get_resolver()
+        team_abbreviation, _, rest = query.partition(" ")
+        team_id = (
+            resolver.get_team_id_by_abbreviation(team_abbreviation) if rest else None
+        )
+        player_query = rest if team_id is not None else query
+        player_matches = resolver.resolve_player(player_query)
+        if not player_matches:
+            await ctx.send(f"Error getting player, nobody matches {player_query}")
+            return
+        if player_matches[0].score < PLAYER_MATCH_THRESHOLD:
+            suggestions = ", ".join(match.name for match in player_matches)
+            await ctx.send(
+                f"Couldn't find {player_query}, did you mean one of: {suggestions}?"
+            )
+            return
+        player_id = player_matches[0].item
+        player_name = player_matches[0].name
+
+        if team_id is None:
+            try:
+                team_id = await get_current_team_id_with_retry(player_id)
+            except Exception as e:
+                await ctx.send(f"Error getting team {e}")
+                return
+            if team_id is None:
+                await ctx.send(
+                    f"{player_name} isn't on a team, try again with a team abbreviation"
+                )
+                return
+
+        await ctx.send(
+            f"Getting the most recent game for {player_name}, please be patient..."
+        )
+        most_recent_game_data = await get_most_recent_game_with_retry(
+            team_id, player_id
+        )
+        if most_recent_game_data is None:
+            await ctx.send(
+                f"Sorry, couldn't get the most recent game for {player_name}"
+            )
+            return
+
+        game_description = (
+            f"{most_recent_game_data.home_team} vs {most_recent_game_data.away_team} on "
+            f"{most_recent_game_data.game_date.strftime('%A')} {most_recent_game_data.game_date}"
+        )
+        game_message = await ctx.send(
+            f"Found a game: {game_description}. Show {len(most_recent_game_data.plays)} highlights now?"
+        )
+        await game_message.add_reaction(NBA_CONFIRMATION_EMOJI)
+
+        def is_confirmed(reaction, user):
+            return user == ctx.author and str(reaction.emoji) == NBA_CONFIRMATION_EMOJI
+
+        await self.bot.wait_for("reaction_add", timeout=60.0, check=is_confirmed)
+
+        await self._run_highlights_task(
+            ctx.author.id, self._send_highlights(ctx, most_recent_game_data)
+        )
+
+    @commands.command(help="Stop sending the highlights you asked for")
+    async def stophighlights(self, ctx):
+        task = self._highlights_tasks.get(ctx.author.id)
+        if task is None:
+            await ctx.send("You don't have any highlights being sent")
+            return
+        task.cancel()
+        await ctx.send("Stopped sending highlights")
+
+    async def _run_highlights_task(self, user_id: int, coroutine) -> None:
+        # a user only ever has one highlights request going, a new one replaces the old
+        previous_task = self._highlights_tasks.get(user_id)
+        if previous_task is not None:
+            previous_task.cancel()
+        task = asyncio.ensure_future(coroutine)
+        self._highlights_tasks[user_id] = task
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if self._highlights_tasks.get(user_id) is task:
+                del self._highlights_tasks[user_id]
+
+    async def _send_highlights(self, ctx, game_data: GameData) -> None:
+        async for video_data in iter_video_data(game_data):
+            await ctx.send(f"{video_data.description}\n{video_data.uri}")
+
+
+def setup(bot):
+    bot.add_cog(NBAHighlights(bot))
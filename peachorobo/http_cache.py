@@ -0,0 +1,91 @@
+import asyncio
+import json
+from json import JSONDecodeError
+from typing import Any, Callable, Dict, Optional
+
+from typing_extensions import TypedDict
+
+from concurrency import run_blocking
+from config import peachorobo_config
+from http_clients import http_clients
+from resilience import UpstreamStatusError
+from utils import atomic_write_json
+
+
+class CacheEntry(TypedDict):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    value: Any
+
+
+class ConditionalCache:
+    """
+    Conditional GETs for pages we poll that rarely change.
+
+    The ETag/Last-Modified validators of the last 200 response are stored along
+    with the parsed result of that response, both in memory and on disk. Later
+    polls send them back as If-None-Match/If-Modified-Since, and a 304 returns
+    the stored result without downloading or parsing the body again. Keeping
+    them on disk means a restart revalidates instead of refetching everything.
+    Parsed results have to be json serializable.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Optional[Dict[str, CacheEntry]] = None
+        # polls finishing together mustn't write the same temp file at once
+        self._write_lock = asyncio.Lock()
+
+    def _get_entries(self) -> Dict[str, CacheEntry]:
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._entries = json.load(f)
+            except (JSONDecodeError, FileNotFoundError):
+                self._entries = {}
+        return self._entries
+
+    async def fetch(
+        self,
+        url: str,
+        parse: Callable[[str], Any],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Any:
+        entries = self._get_entries()
+        entry = entries.get(url)
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry["etag"] is not None:
+                request_headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"] is not None:
+                request_headers["If-Modified-Since"] = entry["last_modified"]
+        session = http_clients.get_session()
+        async with session.get(url, headers=request_headers) as response:
+            if response.status == 304 and entry is not None:
+                return entry["value"]
+            if response.status != 200:
+                raise UpstreamStatusError(url, response.status)
+            page = await response.text()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+        # parsing large pages is cpu bound, keep it off the event loop
+        value = await run_blocking(parse, page)
+        if etag is None and last_modified is None:
+            # nothing to revalidate with next time
+            entries.pop(url, None)
+            return value
+        entries[url] = {"etag": etag, "last_modified": last_modified, "value": value}
+        async with self._write_lock:
+            # a copy so fetches finishing meanwhile can't change it mid dump
+            await run_blocking(atomic_write_json, self.path, dict(entries))
+        return value
+
+
+_conditional_cache: Optional[ConditionalCache] = None
+
+
+def get_conditional_cache() -> ConditionalCache:
+    global _conditional_cache
+    if _conditional_cache is None:
+        _conditional_cache = ConditionalCache(peachorobo_config.http_cache_path)
+    return _conditional_cache
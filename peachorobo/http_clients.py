@@ -0,0 +1,48 @@
+from typing import Optional
+
+import aiohttp
+
+# connections kept open to any one upstream, etsy/cvs/stats.nba.com are all single hosts
+CONNECTION_LIMIT_PER_HOST = 8
+CONNECTION_LIMIT = 32
+KEEPALIVE_TIMEOUT_SECONDS = 60
+DNS_CACHE_TTL_SECONDS = 300
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10)
+
+
+class HTTPClientRegistry:
+    """
+    Bot scoped aiohttp session shared by every outbound HTTP caller.
+
+    Reusing one session keeps connections to each upstream warm between polls
+    and requests instead of paying DNS, TCP and TLS setup every time. The bot
+    starts it on startup and closes it on shutdown, standalone scripts get one
+    lazily on first use and should close it when done.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        self.get_session()
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=CONNECTION_LIMIT,
+                limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT_SECONDS,
+                ttl_dns_cache=DNS_CACHE_TTL_SECONDS,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=DEFAULT_TIMEOUT
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_clients = HTTPClientRegistry()
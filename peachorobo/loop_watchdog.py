@@ -0,0 +1,145 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+
+# how long a single callback can hold the event loop before it gets reported
+WATCHDOG_THRESHOLD_SECONDS = 0.5
+# a call site that keeps blocking is reported again at most this often
+WATCHDOG_REPORT_COOLDOWN_SECONDS = 60 * 60
+# stack frames included in a report, innermost last
+WATCHDOG_STACK_LIMIT = 15
+DISCORD_MESSAGE_LIMIT = 2000
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# line numbers can be missing from frames of generated code
+CallSite = Tuple[str, Optional[int], str]
+
+
+def _get_call_site(stack: traceback.StackSummary) -> CallSite:
+    # blame the innermost line of our own code, the library frames below it are just what it called
+    for frame in reversed(stack):
+        if os.path.abspath(frame.filename).startswith(PROJECT_DIR):
+            return frame.filename, frame.lineno, frame.name
+    frame = stack[-1]
+    return frame.filename, frame.lineno, frame.name
+
+
+def _get_callback_stack(frame) -> traceback.StackSummary:
+    stack = traceback.extract_stack(frame)
+    # drop the event loop's own frames, the report is about the callback it was running
+    for position in range(len(stack) - 1, -1, -1):
+        if stack[position].name == "_run" and stack[position].filename.endswith(
+            os.path.join("asyncio", "events.py")
+        ):
+            return traceback.StackSummary.from_list(stack[position + 1 :])
+    return stack
+
+
+class LoopWatchdog:
+    """
+    Detects callbacks that hold the event loop longer than `threshold` seconds.
+
+    A heartbeat coroutine on the loop records when it last ran. A daemon
+    thread checks the heartbeat and when it falls behind grabs the loop
+    thread's current stack with sys._current_frames, which is the coroutine
+    that is blocking. Once the loop recovers `report` is called on the loop
+    with the duration and stack, at most once per call site per cooldown.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        report: Callable[[str], Coroutine[Any, Any, None]],
+        threshold: float = WATCHDOG_THRESHOLD_SECONDS,
+    ):
+        self.loop = loop
+        self.report = report
+        self.threshold = threshold
+        self.interval = threshold / 4
+        self._last_beat = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._last_reported_at: Dict[CallSite, float] = {}
+        self._suppressed: Dict[CallSite, int] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        self._heartbeat = self.loop.create_task(self._beat())
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+
+    async def _beat(self) -> None:
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        while True:
+            self._last_beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self) -> None:
+        stalled_since: Optional[float] = None
+        stack: Optional[traceback.StackSummary] = None
+        while not self._stopped.wait(self.interval):
+            if self._loop_thread_id is None:
+                continue
+            last_beat = self._last_beat
+            if stalled_since is not None and last_beat != stalled_since:
+                # the loop is running again, the stall lasted until this beat
+                if stack is not None:
+                    self._on_blocked(last_beat - stalled_since - self.interval, stack)
+                stalled_since = stack = None
+            elif (
+                stalled_since is None
+                and time.monotonic() - last_beat > self.interval + self.threshold
+            ):
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    stalled_since = last_beat
+                    stack = _get_callback_stack(frame)
+
+    def _on_blocked(self, duration: float, stack: traceback.StackSummary) -> None:
+        call_site = _get_call_site(stack)
+        now = time.monotonic()
+        last_reported_at = self._last_reported_at.get(call_site)
+        if (
+            last_reported_at is not None
+            and now - last_reported_at < WATCHDOG_REPORT_COOLDOWN_SECONDS
+        ):
+            self._suppressed[call_site] = self._suppressed.get(call_site, 0) + 1
+            return
+        self._last_reported_at[call_site] = now
+        suppressed = self._suppressed.pop(call_site, 0)
+        message = _format_report(duration, call_site, stack, suppressed)
+        print(message)
+        asyncio.run_coroutine_threadsafe(self.report(message), self.loop)
+
+
+def _format_report(
+    duration: float,
+    call_site: CallSite,
+    stack: traceback.StackSummary,
+    suppressed: int,
+) -> str:
+    filename, lineno, name = call_site
+    header = (
+        f"Event loop blocked for {duration:.2f}s in {name} "
+        f"({os.path.basename(filename)}:{lineno})"
+    )
+    if suppressed:
+        header += f", {suppressed} more times since the last report"
+    lines: List[str] = traceback.format_list(stack[-WATCHDOG_STACK_LIMIT:])
+    trace = "".join(lines).rstrip()
+    # keep the innermost frames when the message is too long for discord
+    room = DISCORD_MESSAGE_LIMIT - len(header) - len("\n```\n\n```")
+    return f"{header}\n```\n{trace[-room:]}\n```"
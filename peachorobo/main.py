@@ -1,8 +1,15 @@
 import argparse
+import functools
+import time
 
-from cogs import bot, PreDinner, PostDinner, WackWatch, NBAHighlights
-from vacwatch import VacWatch
+from bot import create_bot, send_to_debug_channel
 from config import peachorobo_config
+from loop_watchdog import LoopWatchdog, WATCHDOG_THRESHOLD_SECONDS
+
+# always loaded, each is a module with a setup(bot) function
+EXTENSIONS = ["cogs", "wackwatch", "stats"]
+# only loaded for dry runs, these pull in nba_api and friends
+DRY_RUN_EXTENSIONS = ["vacwatch", "highlights"]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="peachorobo!!")
@@ -12,12 +19,47 @@ if __name__ == "__main__":
         required=False,
         help="run as dry run",
     )
+    parser.add_argument(
+        "--sharded",
+        action="store_true",
+        required=False,
+        help="run as an AutoShardedBot",
+    )
+    parser.add_argument(
+        "--lean",
+        action="store_true",
+        required=False,
+        help="only cache the members of a server when scheduling a dinner in it",
+    )
+    parser.add_argument(
+        "--watchdog",
+        type=float,
+        nargs="?",
+        const=WATCHDOG_THRESHOLD_SECONDS,
+        required=False,
+        metavar="SECONDS",
+        help="report anything blocking the event loop for longer than this to the debug channel",
+    )
+    parser.add_argument(
+        "--import-report",
+        action="store_true",
+        required=False,
+        help="print the slowest imports of the loaded extensions before starting",
+    )
     args = parser.parse_args()
     peachorobo_config.load(not args.dry)
-    bot.add_cog(PreDinner(bot))
-    bot.add_cog(PostDinner(bot))
-    bot.add_cog(WackWatch(bot))
-    if args.dry:
-        bot.add_cog(VacWatch(bot))
-        bot.add_cog(NBAHighlights(bot))
+    bot = create_bot(sharded=args.sharded, lean=args.lean)
+    extensions = EXTENSIONS + (DRY_RUN_EXTENSIONS if args.dry else [])
+    if args.import_report:
+        from startup_report import print_import_report
+
+        print_import_report(extensions)
+    for extension in extensions:
+        started_at = time.perf_counter()
+        bot.load_extension(extension)
+        print(f"Loaded {extension} in {time.perf_counter() - started_at:.2f}s")
+    if args.watchdog is not None:
+        LoopWatchdog(
+            bot.loop, functools.partial(send_to_debug_channel, bot), args.watchdog
+        ).start()
     bot.run(peachorobo_config.discord_bot_token)
@@ -0,0 +1,154 @@
+import bisect
+import functools
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Tuple
+
+COMMAND_LATENCY = "peachorobo_command_duration_seconds"
+COMMAND_ERRORS = "peachorobo_command_errors_total"
+UPSTREAM_LATENCY = "peachorobo_upstream_call_duration_seconds"
+UPSTREAM_ERRORS = "peachorobo_upstream_errors_total"
+TASK_DURATION = "peachorobo_task_duration_seconds"
+LOOP_LAG = "peachorobo_event_loop_lag_seconds"
+
+HELP = {
+    COMMAND_LATENCY: "Time from a command's checks passing to it finishing",
+    COMMAND_ERRORS: "Commands that failed, by error type",
+    UPSTREAM_LATENCY: "Duration of each attempt at calling an external service",
+    UPSTREAM_ERRORS: "Failed attempts at calling an external service, by error type",
+    TASK_DURATION: "Duration of each iteration of a background task",
+    LOOP_LAG: "How late the event loop woke up the heartbeat",
+}
+
+# upper bounds in seconds, from a blocked loop tick up to a slow upstream with retries
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class Histogram:
+    buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    counts: List[int] = field(default_factory=lambda: [0] * len(DEFAULT_BUCKETS))
+    count: int = 0
+    sum: float = 0.0
+    max: float = 0.0
+    last: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.last = value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile, capped at the max seen"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    In process counters and histograms, use the `metrics` instance.
+
+    Everything is recorded from the event loop thread, so there's no locking.
+    Rendered in the Prometheus text format for node_exporter's textfile
+    collector and summarized by the !stats command.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, int]] = {}
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    def increment(self, name: str, amount: int = 1, **labels: str) -> None:
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def render(self) -> str:
+        lines = []
+        for name, counter_series in sorted(self.counters.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(counter_series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, histogram_series in sorted(self.histograms.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(histogram_series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if math.isinf(bound) else repr(bound)
+                    bucket_labels = _format_labels(labels + (("le", le),))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def timed(name: str, **labels: str) -> Callable:
+    """Record each call of the decorated coroutine function in the `name` histogram"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with metrics.timer(name, **labels):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+metrics = MetricsRegistry()
@@ -1,14 +1,33 @@
 import asyncio
-from dataclasses import dataclass
-from datetime import date
-from time import sleep
-from typing import List, Optional
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 import aiohttp
-from nba_api.stats.endpoints import videodetails
-from nba_api.stats.library.parameters import ContextMeasureDetailed
-from nba_api.stats.static import players
-from nba_api.stats.static import teams
+from pytz import timezone
+
+from concurrency import SingleFlight, run_blocking
+from config import peachorobo_config
+from disk_cache import DiskLRUCache
+from http_clients import http_clients
+from nba_resolver import get_resolver
+from resilience import RetryPolicy, UpstreamStatusError, call_with_retry
+
+# stats.nba.com is slow to answer and often just never does
+VIDEO_DATA_TIMEOUT = aiohttp.ClientTimeout(total=20, connect=10)
+NBA_UPSTREAM = "stats.nba.com"
+VIDEO_EVENTS_ASSET_URL = "https://stats.nba.com/stats/videoeventsasset"
+NBA_RETRY_POLICY = RetryPolicy(
+    attempts=4, initial_delay=2.0, max_delay=20.0, deadline=60.0
+)
+# video lookups in flight at once for a single highlights request
+HIGHLIGHT_FETCH_CONCURRENCY = 4
+# video assets of a play never change so they're kept until evicted, the most
+# recent game for a player changes at most daily but is cached briefly in case of
+# a game in progress
+VIDEO_DATA_CACHE_MAX_ENTRIES = 20000
+GAME_DATA_CACHE_MAX_ENTRIES = 500
+GAME_DATA_CACHE_TTL_SECONDS = 10 * 60
 
 
 @dataclass
@@ -42,62 +61,166 @@ class NoHighlightsFoundError(Exception):
     pass
 
 
+_video_data_cache: Optional[DiskLRUCache] = None
+_game_data_cache: Optional[DiskLRUCache] = None
+_most_recent_game_flights: SingleFlight[Optional[GameData]] = SingleFlight()
+_video_data_flights: SingleFlight[Optional[VideoData]] = SingleFlight()
+
+
 async def main():
     team_abbreviation = "DEN"
     player_name = "Nikola Jokic"
-    team_id = get_team_id(team_abbreviation.upper())
-    player_id = get_player_id(player_name.title())
-    game_data = get_most_recent_game_with_retry(team_id, player_id)
-    video_datas = []
-    for play_data in game_data.plays:
-        video_data = await get_video_data_with_retry(
-            HighlightData(game_id=game_data.game_id, event_id=play_data.event_id)
-        )
-        if video_data is None:
-            continue
-        video_datas.append(video_data)
+    team_id = get_team_id(team_abbreviation)
+    player_id = get_player_id(player_name)
+    game_data = await get_most_recent_game_with_retry(team_id, player_id)
+    video_datas = [video_data async for video_data in iter_video_data(game_data)]
     print(video_datas)
+    await http_clients.close()
 
 
-def get_most_recent_game_with_retry(team_id: str, player_id: str) -> Optional[GameData]:
-    retries = 0
-    game_data = None
-    while retries < 5 and game_data is None:
-        try:
-            game_data = get_most_recent_game(team_id, player_id)
-        except NoHighlightsFoundError as e:
-            return None
-        except Exception as e:
-            print(
-                f"Error getting most recent game: {type(e)} {e}, sleeping 60, retries: {retries}"
-            )
-            sleep(60)
-            retries += 1
+def _get_video_data_cache() -> DiskLRUCache:
+    global _video_data_cache
+    if _video_data_cache is None:
+        _video_data_cache = DiskLRUCache(
+            peachorobo_config.nba_cache_path,
+            "video_data",
+            max_entries=VIDEO_DATA_CACHE_MAX_ENTRIES,
+        )
+    return _video_data_cache
+
+
+def _get_game_data_cache() -> DiskLRUCache:
+    global _game_data_cache
+    if _game_data_cache is None:
+        _game_data_cache = DiskLRUCache(
+            peachorobo_config.nba_cache_path,
+            "game_data",
+            max_entries=GAME_DATA_CACHE_MAX_ENTRIES,
+            ttl_seconds=GAME_DATA_CACHE_TTL_SECONDS,
+        )
+    return _game_data_cache
+
+
+def _serialize_game_data(game_data: GameData) -> Dict[str, Any]:
+    serialized_game_data = asdict(game_data)
+    serialized_game_data["game_date"] = game_data.game_date.isoformat()
+    return serialized_game_data
+
+
+def _deserialize_game_data(serialized_game_data: Dict[str, Any]) -> GameData:
+    return GameData(
+        game_id=serialized_game_data["game_id"],
+        game_date=date.fromisoformat(serialized_game_data["game_date"]),
+        home_team=serialized_game_data["home_team"],
+        away_team=serialized_game_data["away_team"],
+        plays=[PlayData(**play) for play in serialized_game_data["plays"]],
+    )
+
+
+async def get_most_recent_game_with_retry(
+    team_id: int, player_id: int
+) -> Optional[GameData]:
+    # people tend to ask for the same player right after a game, share the lookup
+    return await _most_recent_game_flights.do(
+        (team_id, player_id), lambda: _get_most_recent_game(team_id, player_id)
+    )
+
+
+async def _get_most_recent_game(team_id: int, player_id: int) -> Optional[GameData]:
+    today = datetime.now(timezone("US/Eastern")).date()
+    cache_key = f"{team_id}:{player_id}:{today.isoformat()}"
+    # sqlite reads commit the access time, keep them off the event loop
+    cached_game_data = await run_blocking(_get_game_data_cache().get, cache_key)
+    if cached_game_data is not None:
+        return _deserialize_game_data(cached_game_data)
+    try:
+        game_data = await call_with_retry(
+            NBA_UPSTREAM,
+            lambda: run_blocking(get_most_recent_game, team_id, player_id),
+            NBA_RETRY_POLICY,
+        )
+    except NoHighlightsFoundError:
+        return None
+    except Exception as e:
+        print(f"Error getting most recent game: {type(e)} {e}")
+        return None
+    await run_blocking(
+        _get_game_data_cache().set, cache_key, _serialize_game_data(game_data)
+    )
     return game_data
 
 
+async def get_current_team_id_with_retry(player_id: int) -> Optional[int]:
+    return await call_with_retry(
+        NBA_UPSTREAM,
+        lambda: run_blocking(get_current_team_id, player_id),
+        NBA_RETRY_POLICY,
+    )
+
+
 async def get_video_data_with_retry(
     highlight_data: HighlightData,
 ) -> Optional[VideoData]:
-    retries = 0
-    video_data = None
-    while retries < 5 and video_data is None:
-        try:
-            video_data = await get_video_data(
-                highlight_data.game_id, highlight_data.event_id
+    return await _video_data_flights.do(
+        (highlight_data.game_id, highlight_data.event_id),
+        lambda: _get_video_data(highlight_data),
+    )
+
+
+async def _get_video_data(highlight_data: HighlightData) -> Optional[VideoData]:
+    cache_key = f"{highlight_data.game_id}:{highlight_data.event_id}"
+    cached_video_data = await run_blocking(_get_video_data_cache().get, cache_key)
+    if cached_video_data is not None:
+        return VideoData(**cached_video_data)
+    try:
+        video_data = await call_with_retry(
+            NBA_UPSTREAM,
+            lambda: get_video_data(highlight_data.game_id, highlight_data.event_id),
+            NBA_RETRY_POLICY,
+        )
+    except Exception as e:
+        print(f"Error getting video data: {type(e)} {e}")
+        return None
+    if video_data is not None:
+        await run_blocking(_get_video_data_cache().set, cache_key, asdict(video_data))
+    return video_data
+
+
+async def iter_video_data(
+    game_data: GameData, concurrency: int = HIGHLIGHT_FETCH_CONCURRENCY
+) -> AsyncIterator[VideoData]:
+    """
+    Fetch the video for every play in the game, yielding them in play order.
+
+    Up to `concurrency` fetches run at once and each video is yielded as soon as
+    it and every play before it are done, so the first highlights arrive while
+    the rest are still loading. Fetches still in flight are cancelled if the
+    caller stops iterating or is cancelled.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(play_data: PlayData) -> Optional[VideoData]:
+        async with semaphore:
+            return await get_video_data_with_retry(
+                HighlightData(game_id=game_data.game_id, event_id=play_data.event_id)
             )
+
+    fetches = [asyncio.ensure_future(fetch(play_data)) for play_data in game_data.plays]
+    try:
+        for video_data_future in fetches:
+            video_data = await video_data_future
             if video_data is not None:
-                return video_data
-        except Exception as e:
-            print(
-                f"Error getting video data: {type(e)} {e}, sleeping 60, retries: {retries}"
-            )
-            sleep(60)
-            retries += 1
-    return None
+                yield video_data
+    finally:
+        for video_data_future in fetches:
+            video_data_future.cancel()
 
 
-def get_most_recent_game(team_id: str, player_id: str) -> GameData:
+def get_most_recent_game(team_id: int, player_id: int) -> GameData:
+    # nba_api's endpoints import pandas, so they're only loaded on the first lookup
+    from nba_api.stats.endpoints import videodetails
+    from nba_api.stats.library.parameters import ContextMeasureDetailed
+
     print("Getting most recent game")
     video = videodetails.VideoDetails(
         context_measure_detailed=ContextMeasureDetailed.ast,
@@ -131,16 +254,29 @@ def get_most_recent_game(team_id: str, player_id: str) -> GameData:
     )
 
 
-def get_team_id(team_abbreviation: str) -> str:
-    nba_teams = teams.get_teams()
-    team = [team for team in nba_teams if team["abbreviation"] == team_abbreviation][0]
-    return team["id"]
+def get_team_id(team_abbreviation: str) -> int:
+    team_id = get_resolver().get_team_id_by_abbreviation(team_abbreviation)
+    if team_id is None:
+        raise ValueError(f"No team with abbreviation {team_abbreviation}")
+    return team_id
+
+
+def get_player_id(player_name: str) -> int:
+    matches = get_resolver().resolve_player(player_name, limit=1)
+    if not matches:
+        raise ValueError(f"No player named {player_name}")
+    return matches[0].item
 
 
-def get_player_id(player_name: str) -> str:
-    nba_players = players.get_players()
-    player = [player for player in nba_players if player["full_name"] == player_name][0]
-    return player["id"]
+def get_current_team_id(player_id: int) -> Optional[int]:
+    from nba_api.stats.endpoints import commonplayerinfo
+
+    player_info = commonplayerinfo.CommonPlayerInfo(
+        player_id=player_id
+    ).get_normalized_dict()
+    team_id = player_info["CommonPlayerInfo"][0]["TEAM_ID"]
+    # free agents and retired players have no team
+    return team_id or None
 
 
 async def get_video_data(game_id: str, event_id: int) -> Optional[VideoData]:
@@ -158,25 +294,30 @@ async def get_video_data(game_id: str, event_id: int) -> Optional[VideoData]:
         "Pragma": "no-cache",
         "Cache-Control": "no-cache",
     }
-    url = f"https://stats.nba.com/stats/videoeventsasset?GameEventID={event_id}&GameID={game_id}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as r:
-            if r.status == 200:
-                json = await r.json()
-                video_urls = json["resultSets"]["Meta"]["videoUrls"]
-                playlist = json["resultSets"]["playlist"]
-                video_data = VideoData(
-                    uri=video_urls[0]["lurl"], description=playlist[0]["dsc"]
-                )
-                print(
-                    f"Success got video data for event_id: {event_id}, game_id: {game_id}"
-                )
-                return video_data
-            else:
-                print(
-                    f"Error getting video data for event_id: {event_id}, game_id: {game_id}, error: {r}"
-                )
-                raise ValueError("Request status not 200")
+    params = {"GameEventID": event_id, "GameID": game_id}
+    session = http_clients.get_session()
+    async with session.get(
+        VIDEO_EVENTS_ASSET_URL,
+        params=params,
+        headers=headers,
+        timeout=VIDEO_DATA_TIMEOUT,
+    ) as r:
+        if r.status == 200:
+            json = await r.json()
+            video_urls = json["resultSets"]["Meta"]["videoUrls"]
+            playlist = json["resultSets"]["playlist"]
+            video_data = VideoData(
+                uri=video_urls[0]["lurl"], description=playlist[0]["dsc"]
+            )
+            print(
+                f"Success got video data for event_id: {event_id}, game_id: {game_id}"
+            )
+            return video_data
+        else:
+            print(
+                f"Error getting video data for event_id: {event_id}, game_id: {game_id}, error: {r}"
+            )
+            raise UpstreamStatusError(NBA_UPSTREAM, r.status)
 
 
 if __name__ == "__main__":
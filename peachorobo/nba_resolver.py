@@ -0,0 +1,141 @@
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Generic, List, Optional, Set, TypeVar
+
+from nba_api.stats.static import players, teams
+
+T = TypeVar("T")
+
+# how many ranked matches to return for a lookup
+DEFAULT_LIMIT = 5
+# shortest token prefix indexed, single letters would match most of the league
+MIN_PREFIX_LENGTH = 2
+# ranking boost for a query token that is a prefix of a name token, so "jok" finds "jokic"
+PREFIX_MATCH_BONUS = 0.3
+# slight preference for current players over retired ones with similar names
+ACTIVE_PLAYER_BONUS = 0.05
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, fold accents and drop punctuation so "Nikola Jokić" == "nikola jokic" """
+    decomposed = unicodedata.normalize("NFKD", name)
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^a-z0-9 ]", "", folded.lower()).split())
+
+
+def _trigrams(normalized_name: str) -> Set[str]:
+    padded = f"  {normalized_name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class Match(Generic[T]):
+    item: T
+    name: str
+    score: float
+
+
+class NameIndex(Generic[T]):
+    """
+    Exact, prefix and trigram indexes over normalized names.
+
+    An exact normalized match always ranks first. Otherwise candidates are only
+    the names sharing a trigram or token prefix with the query, ranked by
+    trigram similarity plus a bonus for prefix matches, so a lookup never
+    scans every name.
+    """
+
+    def __init__(self):
+        self._names: List[str] = []
+        self._items: List[T] = []
+        self._trigram_counts: List[int] = []
+        self._bonuses: List[float] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._by_prefix: Dict[str, Set[int]] = {}
+        self._by_trigram: Dict[str, List[int]] = {}
+
+    def add(self, name: str, item: T, bonus: float = 0.0) -> None:
+        position = len(self._items)
+        normalized = normalize_name(name)
+        trigrams = _trigrams(normalized)
+        self._names.append(name)
+        self._items.append(item)
+        self._trigram_counts.append(len(trigrams))
+        self._bonuses.append(bonus)
+        self._exact.setdefault(normalized, []).append(position)
+        for token in normalized.split():
+            for end in range(MIN_PREFIX_LENGTH, len(token) + 1):
+                self._by_prefix.setdefault(token[:end], set()).add(position)
+        for trigram in trigrams:
+            self._by_trigram.setdefault(trigram, []).append(position)
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> List[Match[T]]:
+        normalized = normalize_name(query)
+        if not normalized:
+            return []
+        exact_positions = self._exact.get(normalized, [])
+        query_trigrams = _trigrams(normalized)
+        shared_trigrams: Counter = Counter()
+        for trigram in query_trigrams:
+            shared_trigrams.update(self._by_trigram.get(trigram, ()))
+        prefix_matches: Counter = Counter()
+        query_tokens = normalized.split()
+        for token in query_tokens:
+            prefix_matches.update(self._by_prefix.get(token, ()))
+        scores = {}
+        for position in set(shared_trigrams) | set(prefix_matches):
+            similarity = (
+                2
+                * shared_trigrams[position]
+                / (len(query_trigrams) + self._trigram_counts[position])
+            )
+            prefix_bonus = (
+                PREFIX_MATCH_BONUS * prefix_matches[position] / len(query_tokens)
+            )
+            scores[position] = min(
+                similarity + prefix_bonus + self._bonuses[position], 0.99
+            )
+        for position in exact_positions:
+            scores[position] = 1.0 + self._bonuses[position]
+        ranked = sorted(scores, key=lambda position: scores[position], reverse=True)
+        return [
+            Match(
+                item=self._items[position],
+                name=self._names[position],
+                score=min(scores[position], 1.0),
+            )
+            for position in ranked[:limit]
+        ]
+
+
+class NBAResolver:
+    """Resolves user typed team abbreviations and player names to nba_api ids"""
+
+    def __init__(self):
+        self._teams_by_abbreviation = {
+            team["abbreviation"]: team["id"] for team in teams.get_teams()
+        }
+        self._player_index: NameIndex[int] = NameIndex()
+        for player in players.get_players():
+            bonus = ACTIVE_PLAYER_BONUS if player["is_active"] else 0.0
+            self._player_index.add(player["full_name"], player["id"], bonus)
+
+    def get_team_id_by_abbreviation(self, abbreviation: str) -> Optional[int]:
+        return self._teams_by_abbreviation.get(abbreviation.upper())
+
+    def resolve_player(
+        self, query: str, limit: int = DEFAULT_LIMIT
+    ) -> List[Match[int]]:
+        return self._player_index.search(query, limit)
+
+
+_resolver: Optional[NBAResolver] = None
+
+
+def get_resolver() -> NBAResolver:
+    global _resolver
+    if _resolver is None:
+        _resolver = NBAResolver()
+    return _resolver
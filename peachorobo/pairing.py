@@ -0,0 +1,154 @@
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# a repeat from the last dinner costs 1, from the one before 0.5 and so on
+HISTORY_DECAY = 0.5
+# an excluded pair is only ever chosen when there's no way around it
+EXCLUDED_PAIR_COST = 1e6
+# local search stops after this many moves or this long, whichever comes first
+MAX_SEARCH_ITERATIONS = 200_000
+SEARCH_TIME_LIMIT_SECONDS = 1.0
+# moves per member without any improvement before the search gives up early
+STALL_ITERATIONS_PER_MEMBER = 50
+
+Pair = Tuple[int, int]
+
+
+class PairingError(Exception):
+    """Every possible cycle gives someone a recipient they're excluded from"""
+
+
+class PairingCosts:
+    """
+    Cost of each giver -> recipient edge.
+
+    Pairs from past dinners cost more the more recent and frequent they were,
+    excluded pairs cost EXCLUDED_PAIR_COST in both directions and everything
+    else is free.
+    """
+
+    def __init__(
+        self,
+        past_pairings: Sequence[Iterable[Pair]] = (),
+        exclusions: Iterable[Pair] = (),
+    ):
+        self._repeat_costs: Dict[Pair, float] = {}
+        # newest dinner first
+        for age, dinner_pairs in enumerate(past_pairings):
+            for pair in dinner_pairs:
+                self._repeat_costs[pair] = (
+                    self._repeat_costs.get(pair, 0.0) + HISTORY_DECAY ** age
+                )
+        self._exclusions: Set[Pair] = set()
+        for giver_id, recipient_id in exclusions:
+            self._exclusions.add((giver_id, recipient_id))
+            self._exclusions.add((recipient_id, giver_id))
+
+    def is_repeat(self, giver_id: int, recipient_id: int) -> bool:
+        return (giver_id, recipient_id) in self._repeat_costs
+
+    def is_excluded(self, giver_id: int, recipient_id: int) -> bool:
+        return (giver_id, recipient_id) in self._exclusions
+
+    def get(self, giver_id: int, recipient_id: int) -> float:
+        if (giver_id, recipient_id) in self._exclusions:
+            return EXCLUDED_PAIR_COST
+        return self._repeat_costs.get((giver_id, recipient_id), 0.0)
+
+
+def make_cycle(
+    member_ids: Sequence[int],
+    costs: PairingCosts,
+    max_iterations: int = MAX_SEARCH_ITERATIONS,
+    time_limit: float = SEARCH_TIME_LIMIT_SECONDS,
+    rng: Optional[random.Random] = None,
+) -> List[int]:
+    """
+    Order members into a single gift cycle, each gives to the next and the last to the first.
+
+    Starts from a random cycle and repeatedly takes a random costly edge and
+    tries swapping its recipient with another member, keeping swaps that don't
+    make the cycle worse. A swap only changes the four edges around the two
+    positions, so each move is O(1) and the search is bounded by
+    `max_iterations` and `time_limit` regardless of roster size, and ends
+    early once every edge is free or it stops improving. Raises
+    PairingError if an excluded pair is still in the best cycle found.
+    """
+    rng = rng or random.Random()
+    order = list(member_ids)
+    rng.shuffle(order)
+    size = len(order)
+    if size < 3:
+        # there's only one cycle
+        _check_exclusions(order, costs)
+        return order
+
+    def edge_cost(edge: int) -> float:
+        return costs.get(order[edge], order[(edge + 1) % size])
+
+    # positions of costly edges, kept in a list + index for O(1) random picks and removal
+    costly_edges: List[int] = []
+    costly_edge_positions: Dict[int, int] = {}
+
+    def update_edge(edge: int) -> None:
+        is_costly = edge_cost(edge) > 0
+        if is_costly and edge not in costly_edge_positions:
+            costly_edge_positions[edge] = len(costly_edges)
+            costly_edges.append(edge)
+        elif not is_costly and edge in costly_edge_positions:
+            position = costly_edge_positions.pop(edge)
+            last_edge = costly_edges.pop()
+            if last_edge != edge:
+                costly_edges[position] = last_edge
+                costly_edge_positions[last_edge] = position
+
+    for edge in range(size):
+        update_edge(edge)
+
+    deadline = time.monotonic() + time_limit
+    stall_limit = STALL_ITERATIONS_PER_MEMBER * size
+    last_improvement = 0
+    for iteration in range(max_iterations):
+        # when every edge is a repeat there's no way to get to zero, stop once it stops improving
+        if not costly_edges or iteration - last_improvement > stall_limit:
+            break
+        # checking the clock every move would cost more than the move
+        if iteration % 1024 == 0 and time.monotonic() > deadline:
+            break
+        edge = costly_edges[rng.randrange(len(costly_edges))]
+        i = (edge + 1) % size
+        j = rng.randrange(size)
+        if i == j:
+            continue
+        affected = {(i - 1) % size, i, (j - 1) % size, j}
+        before = sum(edge_cost(affected_edge) for affected_edge in affected)
+        order[i], order[j] = order[j], order[i]
+        after = sum(edge_cost(affected_edge) for affected_edge in affected)
+        if after > before:
+            order[i], order[j] = order[j], order[i]
+            continue
+        if after < before:
+            last_improvement = iteration
+        for affected_edge in affected:
+            update_edge(affected_edge)
+
+    _check_exclusions(order, costs)
+    return order
+
+
+def _check_exclusions(order: List[int], costs: PairingCosts) -> None:
+    for position, giver_id in enumerate(order):
+        recipient_id = order[(position + 1) % len(order)]
+        if costs.is_excluded(giver_id, recipient_id):
+            raise PairingError(
+                "Couldn't pair everyone without matching excluded members, "
+                "try with fewer exclusions or more people"
+            )
+
+
+def count_repeats(order: List[int], costs: PairingCosts) -> int:
+    return sum(
+        costs.is_repeat(giver_id, order[(position + 1) % len(order)])
+        for position, giver_id in enumerate(order)
+    )
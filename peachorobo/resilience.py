@@ -0,0 +1,210 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import aiohttp
+
+from metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY, metrics
+
+T = TypeVar("T")
+
+# statuses worth retrying, everything else in 4xx means the request itself is wrong
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class UpstreamStatusError(Exception):
+    """An upstream answered with a status we didn't expect"""
+
+    def __init__(self, upstream: str, status: int):
+        super().__init__(f"{upstream} responded with status_code: {status}")
+        self.upstream = upstream
+        self.status = status
+
+
+class CircuitOpenError(Exception):
+    """Calls to an upstream are being skipped because it keeps failing"""
+
+    def __init__(self, upstream: str, retry_in: float):
+        super().__init__(
+            f"{upstream} is failing, not retrying for another {retry_in:.0f} seconds"
+        )
+        self.upstream = upstream
+
+
+def _get_status(error: Exception) -> Optional[int]:
+    # aiohttp, googleapiclient and requests errors all carry the status differently
+    for status in (
+        getattr(error, "status", None),
+        getattr(getattr(error, "resp", None), "status", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error is likely transient: timeouts, connection problems, 429s and 5xxs"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = _get_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    if isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError, ConnectionError)):
+        return True
+    # requests (used by nba_api) raises these for timeouts and connection errors
+    return type(error).__name__ in {"Timeout", "ReadTimeout", "ConnectionError"}
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int
+    initial_delay: float
+    max_delay: float
+    multiplier: float = 2.0
+    # fraction of each delay that is randomized so callers don't retry in lockstep
+    jitter: float = 0.2
+    # total seconds, including waits, after which no more attempts are started
+    deadline: Optional[float] = None
+
+    def get_delay(self, attempt: int) -> float:
+        delay = min(self.initial_delay * self.multiplier ** attempt, self.max_delay)
+        return delay * (1 - self.jitter * random.random())
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream for `reset_timeout` seconds after `failure_threshold`
+    consecutive transient failures, then lets a single trial call through to
+    decide whether to close again.
+    """
+
+    def __init__(self, upstream: str, failure_threshold: int, reset_timeout: float):
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def before_call(self) -> None:
+        if self.state == CircuitState.CLOSED:
+            return
+        elapsed = time.monotonic() - self._opened_at
+        if self.state == CircuitState.OPEN and elapsed >= self.reset_timeout:
+            # this call is the trial, everyone else keeps failing fast until it finishes
+            self.state = CircuitState.HALF_OPEN
+            return
+        raise CircuitOpenError(self.upstream, max(self.reset_timeout - elapsed, 0))
+
+    def record_success(self) -> None:
+        self.state = CircuitState.CLOSED
+        self._failures = 0
+
+    def record_cancelled(self) -> None:
+        # a cancelled call says nothing about the upstream, give the trial slot
+        # back so the next call becomes the trial instead of failing fast forever
+        if self.state == CircuitState.HALF_OPEN:
+            self.state = CircuitState.OPEN
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if (
+            self.state == CircuitState.HALF_OPEN
+            or self._failures >= self.failure_threshold
+        ):
+            self.state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT_SECONDS = 60.0
+
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(upstream: str) -> CircuitBreaker:
+    if upstream not in _circuit_breakers:
+        _circuit_breakers[upstream] = CircuitBreaker(
+            upstream, DEFAULT_FAILURE_THRESHOLD, DEFAULT_RESET_TIMEOUT_SECONDS
+        )
+    return _circuit_breakers[upstream]
+
+
+async def call_with_retry(
+    upstream: str,
+    func: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    retryable: Callable[[Exception], bool] = is_retryable,
+) -> T:
+    """
+    Await `func()` retrying transient failures according to `policy`.
+
+    Every attempt goes through the upstream's circuit breaker, so once an
+    upstream is known to be down callers get a CircuitOpenError straight away
+    instead of waiting out timeouts and backoff. Errors that aren't retryable
+    are raised immediately and don't count against the upstream. Every attempt
+    is recorded in the upstream metrics.
+    """
+    breaker = get_circuit_breaker(upstream)
+    started_at = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            breaker.before_call()
+        except CircuitOpenError as e:
+            metrics.increment(
+                UPSTREAM_ERRORS, upstream=upstream, error=type(e).__name__
+            )
+            raise
+        attempt_started_at = time.perf_counter()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # an Exception before python 3.8, don't let it count as a failure or success
+            breaker.record_cancelled()
+            raise
+        except Exception as e:
+            metrics.observe(
+                UPSTREAM_LATENCY,
+                time.perf_counter() - attempt_started_at,
+                upstream=upstream,
+                outcome="error",
+            )
+            metrics.increment(
+                UPSTREAM_ERRORS, upstream=upstream, error=type(e).__name__
+            )
+            if not retryable(e):
+                # the upstream answered, it's the request that was bad
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            attempt += 1
+            if attempt >= policy.attempts:
+                raise
+            delay = policy.get_delay(attempt - 1)
+            elapsed = time.monotonic() - started_at
+            if policy.deadline is not None and elapsed + delay > policy.deadline:
+                raise
+            print(
+                f"Error calling {upstream}: {type(e)} {e}, retrying in {delay:.1f}s, attempt: {attempt}"
+            )
+            await asyncio.sleep(delay)
+        else:
+            metrics.observe(
+                UPSTREAM_LATENCY,
+                time.perf_counter() - attempt_started_at,
+                upstream=upstream,
+                outcome="ok",
+            )
+            breaker.record_success()
+            return result
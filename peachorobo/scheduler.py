@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from constants import SerializedJob
+from db import DBService, DinnerPartition
+from metrics import TASK_DURATION, metrics
+
+# jobs that came due more than this long ago while the bot was down are dropped, not sent late
+MISSED_JOB_GRACE_SECONDS = 15 * 60
+# the sleeper wakes up at least this often so a wall clock jump can't make it oversleep
+MAX_SLEEP_SECONDS = 5 * 60
+
+# called with every job of one kind in a partition that came due together
+JobHandler = Callable[[DinnerPartition, List[SerializedJob]], Awaitable[None]]
+_JobKey = Tuple[DinnerPartition, int]
+
+
+def _get_due_ts(job: SerializedJob) -> float:
+    return datetime.fromisoformat(job["due_iso"]).timestamp()
+
+
+class JobScheduler:
+    """
+    Runs jobs stored in each partition's DB once they're due.
+
+    Pending jobs sit on a min-heap of due times and a single sleeper task waits
+    for the earliest one, or for an earlier job to be scheduled, so there's no
+    polling per job. Jobs that come due together are handed to their handler
+    as one batch, so a dinner's worth of reminders is one DB read and one
+    write, and removed from the DB once the handler ran so a restart picks up
+    exactly the ones still pending. Cancelled jobs are left on the heap and
+    skipped when they reach the top.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, JobHandler] = {}
+        self._heap: List[Tuple[float, int, _JobKey]] = []
+        self._jobs: Dict[_JobKey, SerializedJob] = {}
+        # tie breaker so the heap never has to compare partitions
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._sleeper: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    def start(self, partitions: Iterable[DinnerPartition]) -> None:
+        """Load the pending jobs of `partitions` and start the sleeper"""
+        if self._sleeper is not None:
+            return
+        missed_before = time.time() - MISSED_JOB_GRACE_SECONDS
+        for partition in partitions:
+            missed_job_ids = []
+            for job in DBService.get_jobs(partition):
+                if _get_due_ts(job) < missed_before:
+                    print(f"Dropping {job['kind']} job {job['id']} missed while down")
+                    missed_job_ids.append(job["id"])
+                else:
+                    self._push(partition, job)
+            if missed_job_ids:
+                DBService.remove_jobs(partition, missed_job_ids)
+        self._wakeup = asyncio.Event()
+        self._sleeper = asyncio.get_event_loop().create_task(
+            self._sleep_until_due(self._wakeup)
+        )
+
+    def stop(self) -> None:
+        if self._sleeper is not None:
+            self._sleeper.cancel()
+            self._sleeper = None
+        for task in list(self._running):
+            task.cancel()
+        self._heap = []
+        self._jobs = {}
+
+    def schedule(
+        self, partition: DinnerPartition, jobs: List[SerializedJob]
+    ) -> List[SerializedJob]:
+        """Persist `jobs` and run each at its due_iso"""
+        jobs = DBService.add_jobs(partition, jobs)
+        for job in jobs:
+            self._push(partition, job)
+        return jobs
+
+    def cancel_dinner(self, partition: DinnerPartition, dinner_id: int) -> None:
+        """Forget the pending jobs of a dinner, the DB drops them when the dinner is cancelled"""
+        for key, job in list(self._jobs.items()):
+            if key[0] == partition and job["dinner_id"] == dinner_id:
+                del self._jobs[key]
+
+    def _push(self, partition: DinnerPartition, job: SerializedJob) -> None:
+        key = (partition, job["id"])
+        self._jobs[key] = job
+        due_ts = _get_due_ts(job)
+        heapq.heappush(self._heap, (due_ts, next(self._sequence), key))
+        # only an earlier deadline than the one being slept on needs a wakeup
+        if self._wakeup is not None and self._heap[0][2] == key:
+            self._wakeup.set()
+
+    async def _sleep_until_due(self, wakeup: asyncio.Event) -> None:
+        while True:
+            wakeup.clear()
+            now = time.time()
+            due_jobs: Dict[Tuple[DinnerPartition, str], List[SerializedJob]] = {}
+            while self._heap and self._heap[0][0] <= now:
+                _, _, key = heapq.heappop(self._heap)
+                job = self._jobs.pop(key, None)
+                if job is not None:
+                    due_jobs.setdefault((key[0], job["kind"]), []).append(job)
+            for (partition, kind), jobs in due_jobs.items():
+                task = asyncio.get_event_loop().create_task(
+                    self._run(partition, kind, jobs)
+                )
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            timeout = (
+                min(self._heap[0][0] - now, MAX_SLEEP_SECONDS) if self._heap else None
+            )
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(
+        self, partition: DinnerPartition, kind: str, jobs: List[SerializedJob]
+    ) -> None:
+        handler = self._handlers.get(kind)
+        try:
+            if handler is None:
+                print(f"No handler for {len(jobs)} {kind} jobs")
+            else:
+                with metrics.timer(TASK_DURATION, task=kind):
+                    await handler(partition, jobs)
+        except asyncio.CancelledError:
+            # cancelled by stop(), keep the jobs so they run again after a restart.
+            # Needs its own clause since it's an Exception before python 3.8
+            raise
+        except Exception as e:
+            print(f"Error running {len(jobs)} {kind} jobs: {type(e)} {e}")
+        DBService.remove_jobs(partition, [job["id"] for job in jobs])
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,48 @@
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Dict, List
+
+# how many of the slowest imports to print
+IMPORT_REPORT_LIMIT = 15
+
+
+@dataclass
+class ImportTime:
+    package: str
+    microseconds: int
+
+
+def get_import_times(modules: List[str]) -> List[ImportTime]:
+    """
+    Import `modules` in a fresh interpreter with `-X importtime` and total the
+    time spent per top level package, slowest first.
+
+    Runs in a subprocess because modules this process already imported would
+    report nothing.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        text=True,
+    )
+    totals: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            # the header line
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(self_us)
+    import_times = [ImportTime(package, us) for package, us in totals.items()]
+    return sorted(import_times, key=lambda t: t.microseconds, reverse=True)
+
+
+def print_import_report(modules: List[str], limit: int = IMPORT_REPORT_LIMIT) -> None:
+    import_times = get_import_times(modules)
+    total_us = sum(t.microseconds for t in import_times)
+    print(f"Importing {', '.join(modules)} takes {total_us / 1e6:.2f}s, slowest:")
+    for import_time in import_times[:limit]:
+        print(f"  {import_time.microseconds / 1e3:8.1f}ms  {import_time.package}")
@@ -0,0 +1,144 @@
+import asyncio
+import os
+from typing import Dict, List
+
+from discord.ext import commands, tasks
+
+from bot import get_peak_memory_mb, on_command_error
+from config import peachorobo_config
+from metrics import (
+    COMMAND_ERRORS,
+    COMMAND_LATENCY,
+    LOOP_LAG,
+    TASK_DURATION,
+    UPSTREAM_ERRORS,
+    UPSTREAM_LATENCY,
+    Histogram,
+    Labels,
+    metrics,
+)
+
+# how often the heartbeat checks that the event loop wakes it up on time
+HEARTBEAT_INTERVAL_SECONDS = 1.0
+METRICS_TEXTFILE_INTERVAL_SECONDS = 15.0
+
+
+def _write_textfile(path: str, text: str) -> None:
+    # node_exporter must never read a half written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _by_label(
+    series: Dict[Labels, Histogram], label: str
+) -> Dict[str, List[Histogram]]:
+    grouped: Dict[str, List[Histogram]] = {}
+    for labels, histogram in series.items():
+        grouped.setdefault(dict(labels)[label], []).append(histogram)
+    return grouped
+
+
+def _merge(histograms: List[Histogram]) -> Histogram:
+    merged = Histogram()
+    for histogram in histograms:
+        merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+        merged.count += histogram.count
+        merged.sum += histogram.sum
+        merged.max = max(merged.max, histogram.max)
+    return merged
+
+
+def _format_histogram(name: str, histogram: Histogram, errors: int = 0) -> str:
+    errors_text = f" errors={errors}" if errors else ""
+    return (
+        f"{name}: n={histogram.count}{errors_text} p50={histogram.quantile(0.5):.3f}s "
+        f"p95={histogram.quantile(0.95):.3f}s max={histogram.max:.3f}s"
+    )
+
+
+def _count_by_label(name: str, label: str) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for labels, value in metrics.counters.get(name, {}).items():
+        key = dict(labels)[label]
+        counts[key] = counts.get(key, 0) + value
+    return counts
+
+
+def get_stats_summary() -> str:
+    lines = []
+    command_errors = _count_by_label(COMMAND_ERRORS, "command")
+    commands_by_name = _by_label(metrics.histograms.get(COMMAND_LATENCY, {}), "command")
+    lines.append("Commands")
+    for command, histograms in sorted(commands_by_name.items()):
+        lines.append(
+            "  "
+            + _format_histogram(
+                command, _merge(histograms), command_errors.get(command, 0)
+            )
+        )
+    upstream_errors = _count_by_label(UPSTREAM_ERRORS, "upstream")
+    upstreams = _by_label(metrics.histograms.get(UPSTREAM_LATENCY, {}), "upstream")
+    lines.append("Upstreams")
+    for upstream in sorted(set(upstreams) | set(upstream_errors)):
+        lines.append(
+            "  "
+            + _format_histogram(
+                upstream,
+                _merge(upstreams.get(upstream, [])),
+                upstream_errors.get(upstream, 0),
+            )
+        )
+    lines.append("Tasks")
+    for task, histograms in sorted(
+        _by_label(metrics.histograms.get(TASK_DURATION, {}), "task").items()
+    ):
+        lines.append("  " + _format_histogram(task, _merge(histograms)))
+    loop_lag = metrics.histograms.get(LOOP_LAG, {}).get((), Histogram())
+    lines.append(
+        _format_histogram("Event loop lag", loop_lag) + f" last={loop_lag.last:.3f}s"
+    )
+    lines.append(f"Peak memory: {get_peak_memory_mb():.1f}MB")
+    return "\n".join(lines)
+
+
+class Stats(commands.Cog):
+    """bot health metrics"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._heartbeat = self.bot.loop.create_task(self.heartbeat())
+        if peachorobo_config.metrics_textfile_path:
+            self.write_textfile.start()
+
+    def cog_unload(self):
+        self._heartbeat.cancel()
+        self.write_textfile.cancel()
+
+    async def cog_command_error(self, ctx, error):
+        await on_command_error(ctx, error)
+
+    async def heartbeat(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            started_at = loop.time()
+            await asyncio.sleep(HEARTBEAT_INTERVAL_SECONDS)
+            lag = loop.time() - started_at - HEARTBEAT_INTERVAL_SECONDS
+            metrics.observe(LOOP_LAG, max(lag, 0.0))
+
+    @tasks.loop(seconds=METRICS_TEXTFILE_INTERVAL_SECONDS)
+    async def write_textfile(self) -> None:
+        try:
+            _write_textfile(peachorobo_config.metrics_textfile_path, metrics.render())
+        except OSError as e:
+            print(f"Error writing metrics: {type(e)} {e}")
+
+    @commands.command(help="Show command, upstream and event loop timings")
+    @commands.is_owner()
+    async def stats(self, ctx: commands.Context):
+        await ctx.send(f"```\n{get_stats_summary()}\n```")
+
+
+def setup(bot):
+    bot.add_cog(Stats(bot))
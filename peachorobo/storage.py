@@ -0,0 +1,565 @@
+import itertools
+import json
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import datetime
+from json import JSONDecodeError
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from constants import (
+    SerializedJob,
+    SerializedMysteryDinner,
+    SerializedPairing,
+    SerializedUser,
+)
+from utils import atomic_write_json
+
+JOURNAL_SUFFIX = ".journal"
+# number of journal records to accumulate before folding them into the snapshot
+COMPACT_EVERY = 100
+# sqlite user_version once the history of the json DB has been carried over
+SQLITE_IMPORTED_VERSION = 1
+
+
+class DinnerStore(ABC):
+    """Storage backend for serialized mystery dinners used by DBService"""
+
+    # bumped whenever the stored state changes so readers can tell if anything
+    # they derived from it is stale
+    version: int = 0
+
+    @abstractmethod
+    def reload_if_changed(self) -> None:
+        """Pick up modifications made by anything other than this store"""
+
+    @abstractmethod
+    def create(self, dinner: SerializedMysteryDinner) -> SerializedMysteryDinner:
+        """Persist a dinner, assigning and returning it with a fresh id"""
+
+    @abstractmethod
+    def get(self, dinner_id: int) -> Optional[SerializedMysteryDinner]:
+        pass
+
+    @abstractmethod
+    def get_latest(self) -> Optional[SerializedMysteryDinner]:
+        pass
+
+    @abstractmethod
+    def get_recent(self, limit: int) -> List[SerializedMysteryDinner]:
+        """The `limit` most recently created dinners, newest first"""
+
+    @abstractmethod
+    def cancel_latest(self) -> Optional[SerializedMysteryDinner]:
+        """Remove the latest dinner along with its jobs"""
+
+    @abstractmethod
+    def get_dinners_for_user(self, user_id: int) -> List[SerializedMysteryDinner]:
+        """Dinners the user was a giver or recipient in, oldest first"""
+
+    @abstractmethod
+    def get_upcoming(self, now: datetime) -> List[SerializedMysteryDinner]:
+        """Dinners scheduled at or after `now`, soonest first"""
+
+    @abstractmethod
+    def add_jobs(self, jobs: List[SerializedJob]) -> List[SerializedJob]:
+        """Persist jobs, assigning and returning them with fresh ids"""
+
+    @abstractmethod
+    def remove_jobs(self, job_ids: List[int]) -> None:
+        pass
+
+    @abstractmethod
+    def get_jobs(self) -> List[SerializedJob]:
+        pass
+
+
+class JournaledDinnerStore(DinnerStore):
+    """
+    Mystery dinners persisted as a snapshot plus an append-only JSONL journal.
+
+    The snapshot lives at `path` and the journal of create/cancel/job records at
+    `path + JOURNAL_SUFFIX`. Writes append a single fsynced line, so they cost
+    O(1) no matter how much history there is, and a crash can at worst leave a
+    torn final line which is dropped on the next replay. Once the journal grows
+    past COMPACT_EVERY records it is folded into a new snapshot that atomically
+    replaces the old one.
+
+    A legacy DB (a bare JSON array of dinners) is read as a snapshot and
+    rewritten in the new format the first time the store compacts.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self._dinners: Dict[int, SerializedMysteryDinner] = {}
+        # ids in creation order, dicts aren't reversible before python 3.8
+        self._dinner_ids: List[int] = []
+        self._dinner_ids_by_user: Dict[int, Set[int]] = {}
+        self._next_id = 1
+        self._jobs: Dict[int, SerializedJob] = {}
+        self._next_job_id = 1
+        self._journal_length = 0
+        self.version = 0
+        self._fingerprint: Tuple[Tuple[int, int], ...] = ()
+        self._load()
+
+    def _stat_files(self) -> Tuple[Tuple[int, int], ...]:
+        stats = []
+        for path in (self.path, self.journal_path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stats.append((0, -1))
+                continue
+            stats.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stats)
+
+    def reload_if_changed(self) -> None:
+        if self._stat_files() != self._fingerprint:
+            self._load()
+
+    def _load(self) -> None:
+        self._dinners = {}
+        self._dinner_ids = []
+        self._dinner_ids_by_user = {}
+        self._next_id = 1
+        self._jobs = {}
+        self._journal_length = 0
+        snapshot = _read_snapshot(self.path)
+        for dinner in snapshot["dinners"]:
+            self._index(dinner)
+        self._next_id = max(snapshot["next_id"], max(self._dinners, default=0) + 1)
+        self._jobs = {job["id"]: job for job in snapshot["jobs"]}
+        self._next_job_id = max(snapshot["next_job_id"], max(self._jobs, default=0) + 1)
+        self._replay_journal()
+        self._fingerprint = self._stat_files()
+        self.version += 1
+
+    def _replay_journal(self) -> None:
+        try:
+            f = open(self.journal_path, "rb")
+        except FileNotFoundError:
+            return
+        good_offset = 0
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except JSONDecodeError:
+                    # torn write from a crash, everything after it is unusable
+                    print(f"Dropping corrupt journal tail at offset {good_offset}")
+                    break
+                self._apply(record)
+                self._journal_length += 1
+                good_offset += len(line)
+        if good_offset != os.path.getsize(self.journal_path):
+            with open(self.journal_path, "r+b") as journal_file:
+                journal_file.truncate(good_offset)
+
+    def _index(self, dinner: SerializedMysteryDinner) -> None:
+        self._unindex(dinner["id"])
+        self._dinners[dinner["id"]] = dinner
+        self._dinner_ids.append(dinner["id"])
+        for user_id in _get_user_ids(dinner):
+            self._dinner_ids_by_user.setdefault(user_id, set()).add(dinner["id"])
+
+    def _unindex(self, dinner_id: int) -> None:
+        dinner = self._dinners.pop(dinner_id, None)
+        if dinner is None:
+            return
+        # cancels always drop the latest dinner
+        if self._dinner_ids[-1] == dinner_id:
+            self._dinner_ids.pop()
+        else:
+            self._dinner_ids.remove(dinner_id)
+        for user_id in _get_user_ids(dinner):
+            self._dinner_ids_by_user[user_id].discard(dinner_id)
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        # records are idempotent so replaying a journal that was already folded
+        # into the snapshot (crash between snapshot replace and truncate) is safe
+        if record["op"] == "create":
+            dinner: SerializedMysteryDinner = record["dinner"]
+            self._index(dinner)
+            self._next_id = max(self._next_id, dinner["id"] + 1)
+        elif record["op"] == "cancel":
+            self._unindex(record["id"])
+            self._jobs = {
+                job_id: job
+                for job_id, job in self._jobs.items()
+                if job["dinner_id"] != record["id"]
+            }
+        elif record["op"] == "add_jobs":
+            for job in record["jobs"]:
+                self._jobs[job["id"]] = job
+                self._next_job_id = max(self._next_job_id, job["id"] + 1)
+        elif record["op"] == "remove_jobs":
+            for job_id in record["ids"]:
+                self._jobs.pop(job_id, None)
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record) + "\n"
+        with open(self.journal_path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(record)
+        self._journal_length += 1
+        if self._journal_length >= COMPACT_EVERY:
+            self.compact()
+        self._fingerprint = self._stat_files()
+        self.version += 1
+
+    def compact(self) -> None:
+        snapshot = {
+            "next_id": self._next_id,
+            "dinners": list(self._dinners.values()),
+            "next_job_id": self._next_job_id,
+            "jobs": list(self._jobs.values()),
+        }
+        atomic_write_json(self.path, snapshot)
+        with open(self.journal_path, "w") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_length = 0
+        self._fingerprint = self._stat_files()
+
+    def create(self, dinner: SerializedMysteryDinner) -> SerializedMysteryDinner:
+        dinner["id"] = self._next_id
+        self._append({"op": "create", "dinner": dinner})
+        return dinner
+
+    def get(self, dinner_id: int) -> Optional[SerializedMysteryDinner]:
+        return self._dinners.get(dinner_id)
+
+    def get_all(self) -> List[SerializedMysteryDinner]:
+        return list(self._dinners.values())
+
+    def get_latest(self) -> Optional[SerializedMysteryDinner]:
+        if not self._dinners:
+            return None
+        return self._dinners[self._dinner_ids[-1]]
+
+    def get_recent(self, limit: int) -> List[SerializedMysteryDinner]:
+        return [
+            self._dinners[dinner_id]
+            for dinner_id in itertools.islice(reversed(self._dinner_ids), limit)
+        ]
+
+    def cancel_latest(self) -> Optional[SerializedMysteryDinner]:
+        latest = self.get_latest()
+        if latest is None:
+            return None
+        self._append({"op": "cancel", "id": latest["id"]})
+        return latest
+
+    def get_dinners_for_user(self, user_id: int) -> List[SerializedMysteryDinner]:
+        dinner_ids = sorted(self._dinner_ids_by_user.get(user_id, ()))
+        return [self._dinners[dinner_id] for dinner_id in dinner_ids]
+
+    def get_upcoming(self, now: datetime) -> List[SerializedMysteryDinner]:
+        upcoming = [
+            (scheduled_time, dinner)
+            for dinner in self._dinners.values()
+            for scheduled_time in [datetime.fromisoformat(dinner["datetime_iso"])]
+            if scheduled_time >= now
+        ]
+        return [dinner for _, dinner in sorted(upcoming, key=lambda item: item[0])]
+
+    def add_jobs(self, jobs: List[SerializedJob]) -> List[SerializedJob]:
+        if not jobs:
+            return []
+        for job_id, job in enumerate(jobs, start=self._next_job_id):
+            job["id"] = job_id
+        self._append({"op": "add_jobs", "jobs": jobs})
+        return jobs
+
+    def remove_jobs(self, job_ids: List[int]) -> None:
+        job_ids = [job_id for job_id in job_ids if job_id in self._jobs]
+        if job_ids:
+            self._append({"op": "remove_jobs", "ids": job_ids})
+
+    def get_jobs(self) -> List[SerializedJob]:
+        return list(self._jobs.values())
+
+
+class SQLiteDinnerStore(DinnerStore):
+    """
+    Mystery dinners stored in SQLite with separate dinners, pairings and users tables.
+
+    Dinner ids are AUTOINCREMENT so a cancelled dinner's id is never handed out
+    again. Pairings are indexed by both user columns and dinners by scheduled
+    time, so per-user history and upcoming dinners don't load everything.
+    Jobs are deleted along with their dinner by the foreign key cascade.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        display_name TEXT NOT NULL,
+        bot INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS dinners (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        datetime_iso TEXT NOT NULL,
+        scheduled_ts REAL NOT NULL,
+        calendar_id TEXT,
+        calendar_uri TEXT
+    );
+    CREATE INDEX IF NOT EXISTS dinners_scheduled_ts ON dinners (scheduled_ts);
+    CREATE TABLE IF NOT EXISTS pairings (
+        dinner_id INTEGER NOT NULL REFERENCES dinners (id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        user_id INTEGER NOT NULL REFERENCES users (id),
+        matched_with_id INTEGER NOT NULL REFERENCES users (id),
+        user_display_name TEXT NOT NULL,
+        matched_with_display_name TEXT NOT NULL,
+        PRIMARY KEY (dinner_id, position)
+    );
+    CREATE INDEX IF NOT EXISTS pairings_user_id ON pairings (user_id);
+    CREATE INDEX IF NOT EXISTS pairings_matched_with_id ON pairings (matched_with_id);
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        due_iso TEXT NOT NULL,
+        dinner_id INTEGER NOT NULL REFERENCES dinners (id) ON DELETE CASCADE,
+        user_id INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS jobs_dinner_id ON jobs (dinner_id);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+        self._data_version = self._get_data_version()
+
+    def _get_data_version(self) -> int:
+        # changes whenever another connection commits to the database
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def reload_if_changed(self) -> None:
+        data_version = self._get_data_version()
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self.version += 1
+
+    def is_empty(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM dinners LIMIT 1").fetchone() is None
+
+    def is_imported(self) -> bool:
+        """Whether the history of the json DB was already carried over, or didn't need to be"""
+        user_version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        return user_version >= SQLITE_IMPORTED_VERSION
+
+    def mark_imported(self) -> None:
+        with self._conn:
+            self._conn.execute(f"PRAGMA user_version = {SQLITE_IMPORTED_VERSION}")
+
+    def create(self, dinner: SerializedMysteryDinner) -> SerializedMysteryDinner:
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO dinners (datetime_iso, scheduled_ts, calendar_id, calendar_uri) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    dinner["datetime_iso"],
+                    datetime.fromisoformat(dinner["datetime_iso"]).timestamp(),
+                    dinner["calendar"]["id"],
+                    dinner["calendar"]["uri"],
+                ),
+            )
+            assert cursor.lastrowid is not None
+            dinner["id"] = cursor.lastrowid
+            self._insert_pairings(dinner)
+        self.version += 1
+        return dinner
+
+    def import_dinner(self, dinner: SerializedMysteryDinner) -> None:
+        """Insert a dinner keeping its existing id, for migrating from another store"""
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO dinners (id, datetime_iso, scheduled_ts, calendar_id, calendar_uri) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    dinner["id"],
+                    dinner["datetime_iso"],
+                    datetime.fromisoformat(dinner["datetime_iso"]).timestamp(),
+                    dinner["calendar"]["id"],
+                    dinner["calendar"]["uri"],
+                ),
+            )
+            self._insert_pairings(dinner)
+        self.version += 1
+
+    def _insert_pairings(self, dinner: SerializedMysteryDinner) -> None:
+        users = {
+            user["id"]: user
+            for pairing in dinner["pairings"]
+            for user in (pairing["user"], pairing["matched_with"])
+        }
+        self._conn.executemany(
+            "INSERT INTO users (id, name, display_name, bot) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET name = excluded.name, "
+            "display_name = excluded.display_name, bot = excluded.bot",
+            [
+                (user["id"], user["name"], user["display_name"], int(user["bot"]))
+                for user in users.values()
+            ],
+        )
+        self._conn.executemany(
+            "INSERT INTO pairings (dinner_id, position, user_id, matched_with_id, "
+            "user_display_name, matched_with_display_name) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    dinner["id"],
+                    position,
+                    pairing["user"]["id"],
+                    pairing["matched_with"]["id"],
+                    pairing["user"]["display_name"],
+                    pairing["matched_with"]["display_name"],
+                )
+                for position, pairing in enumerate(dinner["pairings"])
+            ],
+        )
+
+    def get(self, dinner_id: int) -> Optional[SerializedMysteryDinner]:
+        dinners = self._select_dinners("WHERE id = ?", (dinner_id,))
+        return dinners[0] if dinners else None
+
+    def get_latest(self) -> Optional[SerializedMysteryDinner]:
+        dinners = self._select_dinners("ORDER BY id DESC LIMIT 1", ())
+        return dinners[0] if dinners else None
+
+    def get_recent(self, limit: int) -> List[SerializedMysteryDinner]:
+        return self._select_dinners("ORDER BY id DESC LIMIT ?", (limit,))
+
+    def cancel_latest(self) -> Optional[SerializedMysteryDinner]:
+        latest = self.get_latest()
+        if latest is None:
+            return None
+        with self._conn:
+            self._conn.execute("DELETE FROM dinners WHERE id = ?", (latest["id"],))
+        self.version += 1
+        return latest
+
+    def get_dinners_for_user(self, user_id: int) -> List[SerializedMysteryDinner]:
+        return self._select_dinners(
+            "WHERE id IN (SELECT dinner_id FROM pairings WHERE user_id = ? "
+            "UNION SELECT dinner_id FROM pairings WHERE matched_with_id = ?) ORDER BY id",
+            (user_id, user_id),
+        )
+
+    def get_upcoming(self, now: datetime) -> List[SerializedMysteryDinner]:
+        return self._select_dinners(
+            "WHERE scheduled_ts >= ? ORDER BY scheduled_ts", (now.timestamp(),)
+        )
+
+    def add_jobs(self, jobs: List[SerializedJob]) -> List[SerializedJob]:
+        with self._conn:
+            for job in jobs:
+                cursor = self._conn.execute(
+                    "INSERT INTO jobs (kind, due_iso, dinner_id, user_id) VALUES (?, ?, ?, ?)",
+                    (job["kind"], job["due_iso"], job["dinner_id"], job["user_id"]),
+                )
+                assert cursor.lastrowid is not None
+                job["id"] = cursor.lastrowid
+        self.version += 1
+        return jobs
+
+    def remove_jobs(self, job_ids: List[int]) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids]
+            )
+        self.version += 1
+
+    def get_jobs(self) -> List[SerializedJob]:
+        return [
+            {
+                "id": row["id"],
+                "kind": row["kind"],
+                "due_iso": row["due_iso"],
+                "dinner_id": row["dinner_id"],
+                "user_id": row["user_id"],
+            }
+            for row in self._conn.execute(
+                "SELECT id, kind, due_iso, dinner_id, user_id FROM jobs ORDER BY id"
+            )
+        ]
+
+    def _select_dinners(
+        self, clause: str, params: Tuple[Any, ...]
+    ) -> List[SerializedMysteryDinner]:
+        dinner_rows = self._conn.execute(
+            f"SELECT id, datetime_iso, calendar_id, calendar_uri FROM dinners {clause}",
+            params,
+        ).fetchall()
+        if not dinner_rows:
+            return []
+        dinner_ids = [row["id"] for row in dinner_rows]
+        placeholders = ", ".join("?" for _ in dinner_ids)
+        pairing_rows = self._conn.execute(
+            "SELECT p.dinner_id, p.user_id, p.matched_with_id, p.user_display_name, "
+            "p.matched_with_display_name, u.name AS user_name, u.bot AS user_bot, "
+            "m.name AS matched_with_name, m.bot AS matched_with_bot "
+            "FROM pairings p JOIN users u ON u.id = p.user_id "
+            "JOIN users m ON m.id = p.matched_with_id "
+            f"WHERE p.dinner_id IN ({placeholders}) ORDER BY p.dinner_id, p.position",
+            dinner_ids,
+        ).fetchall()
+        pairings_by_dinner_id: Dict[int, List[SerializedPairing]] = {}
+        for row in pairing_rows:
+            pairings_by_dinner_id.setdefault(row["dinner_id"], []).append(
+                {
+                    "user": _row_to_user(row, "user"),
+                    "matched_with": _row_to_user(row, "matched_with"),
+                }
+            )
+        return [
+            {
+                "id": row["id"],
+                "datetime_iso": row["datetime_iso"],
+                "calendar": {"id": row["calendar_id"], "uri": row["calendar_uri"]},
+                "pairings": pairings_by_dinner_id.get(row["id"], []),
+            }
+            for row in dinner_rows
+        ]
+
+
+def _row_to_user(row: sqlite3.Row, prefix: str) -> SerializedUser:
+    return {
+        "id": row[f"{prefix}_id"],
+        "display_name": row[f"{prefix}_display_name"],
+        "name": row[f"{prefix}_name"],
+        "bot": bool(row[f"{prefix}_bot"]),
+    }
+
+
+def _get_user_ids(dinner: SerializedMysteryDinner) -> Set[int]:
+    return {
+        user["id"]
+        for pairing in dinner["pairings"]
+        for user in (pairing["user"], pairing["matched_with"])
+    }
+
+
+def _read_snapshot(path: str) -> Dict[str, Any]:
+    empty_snapshot = {"next_id": 1, "dinners": [], "next_job_id": 1, "jobs": []}
+    try:
+        with open(path, "r") as f:
+            snapshot = json.load(f)
+    except (JSONDecodeError, FileNotFoundError):
+        return empty_snapshot
+    if isinstance(snapshot, list):
+        # legacy format: a bare array of dinners with ids from len(dinners) + 1
+        return {**empty_snapshot, "dinners": snapshot}
+    # snapshots from before jobs existed don't have them
+    return {**empty_snapshot, **snapshot}
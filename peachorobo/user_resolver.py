@@ -0,0 +1,170 @@
+import asyncio
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+from concurrency import SingleFlight
+from constants import SerializedUser
+
+USER_CACHE_MAX_ENTRIES = 5000
+USER_CACHE_TTL_SECONDS = 60 * 60
+# fetch_user calls in flight at once, each one is a REST request against a shared rate limit
+FETCH_USER_CONCURRENCY = 5
+
+_MISSING = object()
+
+
+class _UserCache:
+    """LRU of resolved users, entries expire USER_CACHE_TTL_SECONDS after being stored"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, Tuple[Optional[discord.User], float]]" = (
+            OrderedDict()
+        )
+
+    def get(self, user_id: int) -> Any:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return _MISSING
+        user, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return _MISSING
+        self._entries.move_to_end(user_id)
+        return user
+
+    def set(self, user_id: int, user: Optional[discord.User]) -> None:
+        self._entries[user_id] = (user, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class UserResolver:
+    """
+    Turns stored user ids back into discord.User objects.
+
+    Looks in its own LRU first, then the gateway cache with bot.get_user, and
+    only then asks the API with fetch_user, a few at a time. Users the API
+    doesn't know are remembered as None so they aren't fetched over and over.
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._cache = _UserCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+        self._fetches: SingleFlight[Optional[discord.User]] = SingleFlight()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_cached(self, user_id: int) -> Any:
+        """The user if it can be found without a request, otherwise _MISSING"""
+        user = self._cache.get(user_id)
+        if user is not _MISSING:
+            return user
+        user = self.bot.get_user(user_id)
+        if user is None:
+            return _MISSING
+        self._cache.set(user_id, user)
+        return user
+
+    async def resolve(self, user_id: int) -> Optional[discord.User]:
+        user = self._get_cached(user_id)
+        if user is not _MISSING:
+            return user
+        return await self._fetches.do(user_id, lambda: self._fetch(user_id))
+
+    async def resolve_many(
+        self, user_ids: Iterable[int]
+    ) -> Dict[int, Optional[discord.User]]:
+        resolved: Dict[int, Optional[discord.User]] = {}
+        missing: List[int] = []
+        for user_id in set(user_ids):
+            user = self._get_cached(user_id)
+            if user is _MISSING:
+                missing.append(user_id)
+            else:
+                resolved[user_id] = user
+        fetched = await asyncio.gather(*(self.resolve(user_id) for user_id in missing))
+        resolved.update(zip(missing, fetched))
+        return resolved
+
+    async def _fetch(self, user_id: int) -> Optional[discord.User]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(FETCH_USER_CONCURRENCY)
+        async with self._semaphore:
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                user = None
+        self._cache.set(user_id, user)
+        return user
+
+
+_resolvers: "weakref.WeakKeyDictionary[commands.Bot, UserResolver]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_user_resolver(bot: commands.Bot) -> UserResolver:
+    if bot not in _resolvers:
+        _resolvers[bot] = UserResolver(bot)
+    return _resolvers[bot]
+
+
+class LazyUser:
+    """
+    A dinner participant as stored in the DB.
+
+    Id, name and display name come from the stored snapshot, the live
+    discord.User is only looked up when something needs it, like sending a DM.
+    """
+
+    __slots__ = ("id", "name", "display_name", "bot", "_resolver")
+
+    def __init__(self, snapshot: SerializedUser, resolver: UserResolver):
+        self.id = snapshot["id"]
+        self.name = snapshot["name"]
+        self.display_name = snapshot["display_name"]
+        self.bot = snapshot["bot"]
+        self._resolver = resolver
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"LazyUser(id={self.id}, name={self.name!r})"
+
+    async def resolve(self) -> Optional[discord.User]:
+        return await self._resolver.resolve(self.id)
+
+    async def send(self, *args, **kwargs) -> discord.Message:
+        user = await self.resolve()
+        if user is None:
+            raise commands.CommandError(
+                f"Couldn't find {self.display_name} on Discord anymore"
+            )
+        return await user.send(*args, **kwargs)
+
+
+async def resolve_users(users: Iterable[LazyUser]) -> None:
+    """Look up every user in one pass so later resolve() and send() calls are cache hits"""
+    users_by_resolver: Dict[UserResolver, List[int]] = {}
+    for user in users:
+        users_by_resolver.setdefault(user._resolver, []).append(user.id)
+    await asyncio.gather(
+        *(
+            resolver.resolve_many(user_ids)
+            for resolver, user_ids in users_by_resolver.items()
+        )
+    )
@@ -1,11 +1,14 @@
+import json
+import os
 from datetime import datetime
+from typing import Any, Dict
 
 import discord
-import parsedatetime
 from pytz import timezone
 
 from constants import SerializedPairing, SerializedUser
 from constants import MysteryDinnerPairing, MysteryDinner, SerializedMysteryDinner
+from user_resolver import LazyUser, get_user_resolver
 
 
 def serialize_pairing(
@@ -24,6 +27,8 @@ def serialize_user(user: discord.User) -> SerializedUser:
 
 
 def parse_raw_datetime(raw_datetime: str) -> datetime:
+    import parsedatetime
+
     cal = parsedatetime.Calendar()
     datetime_obj, status = cal.parseDT(
         datetimeString=raw_datetime, tzinfo=timezone("US/Eastern")
@@ -38,15 +43,34 @@ def get_pretty_datetime(datetime_obj: datetime) -> str:
 
 
 def deserialize_mystery_dinner(dinner: SerializedMysteryDinner, bot) -> MysteryDinner:
+    # users are only looked up on discord once something needs more than their stored name
+    resolver = get_user_resolver(bot)
+    # everyone is both a giver and a recipient, share one LazyUser between the two
+    users: Dict[int, LazyUser] = {}
+
+    def get_user(snapshot: SerializedUser) -> LazyUser:
+        if snapshot["id"] not in users:
+            users[snapshot["id"]] = LazyUser(snapshot, resolver)
+        return users[snapshot["id"]]
+
     return MysteryDinner(
         id=dinner["id"],
         calendar=dinner["calendar"],
         time=datetime.fromisoformat(dinner["datetime_iso"]),
         pairings=[
             MysteryDinnerPairing(
-                user=bot.get_user(pairing["user"]["id"]),
-                matched_with=bot.get_user(pairing["matched_with"]["id"]),
+                user=get_user(pairing["user"]),
+                matched_with=get_user(pairing["matched_with"]),
             )
             for pairing in dinner["pairings"]
         ],
     )
+
+
+def atomic_write_json(path: str, data: Any) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -1,8 +1,11 @@
-import aiohttp
+import json
 
 from discord.ext import commands, tasks
 
 from config import peachorobo_config
+from metrics import TASK_DURATION, timed
+from http_cache import get_conditional_cache
+from resilience import RetryPolicy, call_with_retry
 
 BOSTONIAN_CHANNEL_ID = 817411627682103336
 
@@ -13,6 +16,7 @@ class VacWatch(commands.Cog):
     STATE_ABBREV = "MA"
     CVS_URL = f"http://www.cvs.com/immunizations/covid-19-vaccine.vaccine-status.{STATE_ABBREV}.json?vaccineinfo"
     HEADERS = {"Referer": "https://www.cvs.com/immunizations/covid-19-vaccine"}
+    RETRY_POLICY = RetryPolicy(attempts=3, initial_delay=5.0, max_delay=30.0)
 
     def __init__(self, bot):
         self.bot = bot
@@ -27,6 +31,7 @@ class VacWatch(commands.Cog):
         await ctx.send(f"Finished vac watch")
 
     @tasks.loop(hours=1.0)
+    @timed(TASK_DURATION, task="cvswatch")
     async def cvswatch(self, ctx=None, verbose=False) -> None:
         messages = []
         channel = (
@@ -52,11 +57,20 @@ class VacWatch(commands.Cog):
     async def before_cvswatch(self):
         await self.bot.wait_until_ready()
 
+    def parse_cvs_openings(self, page: str):
+        data = json.loads(page)["responsePayloadData"]["data"][self.STATE_ABBREV]
+        openings = [city for city in data if city["status"] == "Available"]
+        return openings
+
     async def get_cvs_openings(self):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(self.CVS_URL, headers=self.HEADERS) as r:
-                if r.status == 200:
-                    json = await r.json()
-                    data = json["responsePayloadData"]["data"][self.STATE_ABBREV]
-                    openings = [city for city in data if city["status"] == "Available"]
-                    return openings
+        return await call_with_retry(
+            "cvs.com",
+            lambda: get_conditional_cache().fetch(
+                self.CVS_URL, self.parse_cvs_openings, headers=self.HEADERS
+            ),
+            self.RETRY_POLICY,
+        )
+
+
+def setup(bot):
+    bot.add_cog(VacWatch(bot))
@@ -1,13 +1,20 @@
 import asyncio
+import html
+import re
 import time
-
-import aiohttp
-from bs4 import BeautifulSoup
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
 
 from config import peachorobo_config
+from http_cache import get_conditional_cache
+from http_clients import http_clients
+from resilience import RetryPolicy, call_with_retry
 
 URL = "https://www.etsy.com/shop/WicksByWerby"
 SOLD_HREF = "https://www.etsy.com/shop/WicksByWerby/sold"
+ETSY_UPSTREAM = "etsy.com"
+ETSY_RETRY_POLICY = RetryPolicy(attempts=3, initial_delay=2.0, max_delay=10.0)
 
 
 def wack_has_been_run() -> bool:
@@ -29,22 +36,128 @@ def get_internal_num_sales() -> int:
         return int(num)
 
 
+_SOLD_HREF_ATTRIBUTE_RE = re.compile(
+    r"""<a\s[^>]*?href\s*=\s*(["'])""" + re.escape(SOLD_HREF) + r"\1[^>]*>",
+    re.IGNORECASE,
+)
+_LINK_END_RE = re.compile(r"</a\s*>", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]*>")
+# how far back from the href to look for the start of its <a> tag
+_MAX_TAG_PREFIX = 512
+
+
+def _extract_num_sales(page: str) -> Optional[int]:
+    """
+    Pull the sales count out of the sold link without building a DOM.
+
+    Jumps to each occurrence of SOLD_HREF with str.find, checks that it is the
+    href of an <a> tag and reads that link's text, stopping at the first one.
+    Returns None if the page doesn't look the way we expect so the caller can
+    fall back to a full parse.
+    """
+    position = page.find(SOLD_HREF)
+    while position != -1:
+        tag_start = page.rfind("<", max(0, position - _MAX_TAG_PREFIX), position)
+        match = (
+            _SOLD_HREF_ATTRIBUTE_RE.match(page, tag_start) if tag_start != -1 else None
+        )
+        if match is not None:
+            link_end = _LINK_END_RE.search(page, match.end())
+            if link_end is None:
+                return None
+            link_text = page[match.end() : link_end.start()]
+            link_text = html.unescape(_TAG_RE.sub("", link_text)).strip()
+            try:
+                return int(link_text.replace(",", "").split(" ")[0])
+            except ValueError:
+                return None
+        position = page.find(SOLD_HREF, position + len(SOLD_HREF))
+    return None
+
+
+def _parse_num_sales_with_soup(page: str) -> int:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page, "html.parser")
+    num_sales_tags = soup.find_all(href=SOLD_HREF)
+    num_sales_text = num_sales_tags[0].text.replace(",", "")
+    num_sales = int(num_sales_text.split(" ")[0])
+    return num_sales
+
+
+def parse_num_sales(page: str) -> int:
+    num_sales = _extract_num_sales(page)
+    if num_sales is None:
+        print("Targeted sales extraction failed, falling back to BeautifulSoup")
+        num_sales = _parse_num_sales_with_soup(page)
+    return num_sales
+
+
 async def get_live_num_sales() -> int:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(URL) as response:
-            if response.status != 200:
-                raise ValueError(
-                    f"Scraping etsy.com failed, status_code: {response.status}"
-                )
-            page = await response.text()
-            soup = BeautifulSoup(page, "html.parser")
-            num_sales_tags = soup.find_all(href=SOLD_HREF)
-            num_sales_text = num_sales_tags[0].text.replace(",", "")
-            num_sales = int(num_sales_text.split(" ")[0])
-            return num_sales
+    return await call_with_retry(
+        ETSY_UPSTREAM,
+        lambda: get_conditional_cache().fetch(URL, parse_num_sales),
+        ETSY_RETRY_POLICY,
+    )
+
+
+class ReconciliationState(Enum):
+    FETCHING = "fetching"
+    BACKING_OFF = "backing_off"
+    MATCHED = "matched"
+    MISMATCHED = "mismatched"
+
+
+@dataclass
+class SalesReconciliation:
+    did_run: bool
+    state: ReconciliationState
+    internal_num_sales: Optional[int] = None
+    live_num_sales: Optional[int] = None
+    attempts: int = 0
+
+
+async def reconcile_sales() -> SalesReconciliation:
+    """
+    Compare Wack's sales count against etsy.com until they agree or we run out of attempts.
+
+    Etsy usually shows a sale a little before Wack has processed it, so a
+    mismatch is retried with backoff, re-fetching both counts each time. Waiting
+    is done with asyncio.sleep so the bot stays responsive in the meantime.
+    """
+    reconciliation = SalesReconciliation(
+        did_run=wack_has_been_run(), state=ReconciliationState.FETCHING
+    )
+    mismatch_policy = RetryPolicy(
+        attempts=peachorobo_config.wack_retry_attempts,
+        initial_delay=peachorobo_config.wack_retry_initial_delay_seconds,
+        multiplier=peachorobo_config.wack_retry_backoff_multiplier,
+        max_delay=peachorobo_config.wack_retry_max_delay_seconds,
+    )
+    while True:
+        if reconciliation.state == ReconciliationState.FETCHING:
+            reconciliation.attempts += 1
+            reconciliation.live_num_sales = await get_live_num_sales()
+            reconciliation.internal_num_sales = get_internal_num_sales()
+            if reconciliation.live_num_sales == reconciliation.internal_num_sales:
+                reconciliation.state = ReconciliationState.MATCHED
+            elif reconciliation.attempts < mismatch_policy.attempts:
+                reconciliation.state = ReconciliationState.BACKING_OFF
+            else:
+                reconciliation.state = ReconciliationState.MISMATCHED
+        elif reconciliation.state == ReconciliationState.BACKING_OFF:
+            await asyncio.sleep(mismatch_policy.get_delay(reconciliation.attempts - 1))
+            reconciliation.state = ReconciliationState.FETCHING
+        else:
+            return reconciliation
+
+
+async def main():
+    print(await get_live_num_sales())
+    await http_clients.close()
 
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(get_live_num_sales())
+    loop.run_until_complete(main())
     loop.close()
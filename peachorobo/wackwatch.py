@@ -0,0 +1,76 @@
+from discord.ext import commands, tasks
+
+from concurrency import SingleFlight
+from config import peachorobo_config
+from metrics import TASK_DURATION, timed
+from wack_utils import (
+    reconcile_sales,
+    ReconciliationState,
+    SalesReconciliation,
+)
+
+
+class WackWatch(commands.Cog):
+    """utility to monitor wack logs"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.watch.start()
+        # want to only send each alert once. need some kind of hash to tell us if we've sent that kind of alert before
+        # and avoid sending it again
+        self.messages_key = None
+        # the manual command and the scheduled loop can overlap, share one check between them
+        self._reconciliations: SingleFlight[SalesReconciliation] = SingleFlight()
+
+    def cog_unload(self):
+        self.watch.cancel()
+        self._reconciliations.cancel_all()
+
+    @commands.command(
+        help="Manually run wack watch",
+    )
+    async def wackwatch(self, ctx):
+        await ctx.send("Manually running wack watch")
+        await self.watch(ctx=ctx, verbose=True)
+        await ctx.send(f"Finished wack watch")
+
+    @tasks.loop(minutes=5.0)
+    @timed(TASK_DURATION, task="wackwatch")
+    async def watch(self, ctx=None, verbose=False) -> None:
+        messages = []
+        channel = (
+            ctx
+            if ctx is not None
+            else self.bot.get_channel(peachorobo_config.debug_channel_id)
+        )
+        try:
+            reconciliation = await self._reconciliations.do("wack", reconcile_sales)
+            if reconciliation.did_run and verbose:
+                messages.append("Wack ran in last 5 minutes")
+            elif not reconciliation.did_run:
+                messages.append("Wack has not run for more than 5 minutes. ERROR")
+            internal_num_sales = reconciliation.internal_num_sales
+            live_num_sales = reconciliation.live_num_sales
+            if reconciliation.state == ReconciliationState.MISMATCHED:
+                messages.append(
+                    f"Wack error! {internal_num_sales} sales in Wack vs {live_num_sales} sales on etsy.com"
+                )
+            elif verbose:
+                messages.append(
+                    f"Number of sales in Wack ({internal_num_sales}) matches number of sales on etsy.com ({live_num_sales})"
+                )
+        except Exception as e:
+            messages.append(f"Error looking up last wack run: {e}")
+        new_messages_key = hash(tuple(messages))
+        if new_messages_key != self.messages_key:
+            self.messages_key = new_messages_key
+            for message in messages:
+                await channel.send(message)
+
+    @watch.before_loop
+    async def before_watch(self):
+        await self.bot.wait_until_ready()
+
+
+def setup(bot):
+    bot.add_cog(WackWatch(bot))
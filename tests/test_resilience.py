@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from resilience import (
+    CircuitState,
+    RetryPolicy,
+    call_with_retry,
+    get_circuit_breaker,
+)
+
+POLICY = RetryPolicy(attempts=1, initial_delay=0, max_delay=0)
+
+
+def test_cancelled_trial_call_gives_the_trial_back():
+    loop = asyncio.new_event_loop()
+    breaker = get_circuit_breaker("test-cancelled-trial")
+    breaker.state = CircuitState.OPEN
+    breaker._opened_at -= breaker.reset_timeout
+
+    async def hang() -> None:
+        await asyncio.sleep(60)
+
+    async def succeed() -> str:
+        return "ok"
+
+    trial = loop.create_task(call_with_retry(breaker.upstream, hang, POLICY))
+    loop.run_until_complete(asyncio.sleep(0))
+    assert breaker.state == CircuitState.HALF_OPEN
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        loop.run_until_complete(trial)
+    assert breaker.state == CircuitState.OPEN
+    result = loop.run_until_complete(call_with_retry(breaker.upstream, succeed, POLICY))
+    assert result == "ok"
+    assert breaker.state == CircuitState.CLOSED
+    loop.close()
@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+import pytest
+import pytz
+
+import db
+from config import peachorobo_config
+from constants import SerializedJob
+from db import DBService, DinnerPartition
+from scheduler import JobScheduler
+
+PARTITION = DinnerPartition(guild_id=1, channel_id=2)
+
+
+@pytest.fixture
+def loop(tmpdir, monkeypatch):
+    monkeypatch.setattr(peachorobo_config, "db_backend", "journal")
+    monkeypatch.setattr(peachorobo_config, "db_json_path", str(tmpdir.join("db.json")))
+    db._partitions.clear()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+    db._partitions.clear()
+
+
+def make_jobs(
+    kind: str, dinner_id: int, count: int, delay: float
+) -> List[SerializedJob]:
+    due_iso = (datetime.now(pytz.utc) + timedelta(seconds=delay)).isoformat()
+    return [
+        {
+            "id": 0,
+            "kind": kind,
+            "due_iso": due_iso,
+            "dinner_id": dinner_id,
+            "user_id": user_id,
+        }
+        for user_id in range(count)
+    ]
+
+
+def test_jobs_due_together_run_as_one_batch(loop):
+    scheduler = JobScheduler()
+    batches: List[Tuple[str, int]] = []
+
+    async def handle(partition: DinnerPartition, jobs: List[SerializedJob]) -> None:
+        batches.append((jobs[0]["kind"], len(jobs)))
+
+    async def run() -> None:
+        scheduler.register("reminder", handle)
+        scheduler.register("starting", handle)
+        scheduler.start([])
+        scheduler.schedule(PARTITION, make_jobs("reminder", 1, 500, 0.05))
+        scheduler.schedule(PARTITION, make_jobs("starting", 1, 3, 0.05))
+        await asyncio.sleep(0.2)
+        scheduler.stop()
+
+    loop.run_until_complete(run())
+    assert sorted(batches) == [("reminder", 500), ("starting", 3)]
+    assert DBService.get_jobs(PARTITION) == []
+
+
+def test_jobs_of_a_cancelled_dinner_dont_run(loop):
+    scheduler = JobScheduler()
+    ran_dinner_ids: List[int] = []
+
+    async def handle(partition: DinnerPartition, jobs: List[SerializedJob]) -> None:
+        ran_dinner_ids.extend(job["dinner_id"] for job in jobs)
+
+    async def run() -> None:
+        scheduler.register("reminder", handle)
+        scheduler.start([])
+        scheduler.schedule(PARTITION, make_jobs("reminder", 1, 2, 0.05))
+        scheduler.schedule(PARTITION, make_jobs("reminder", 2, 2, 0.05))
+        scheduler.cancel_dinner(PARTITION, 1)
+        await asyncio.sleep(0.2)
+        scheduler.stop()
+
+    loop.run_until_complete(run())
+    assert ran_dinner_ids == [2, 2]
+
+
+def test_jobs_interrupted_by_stop_are_kept_for_the_next_start(loop):
+    scheduler = JobScheduler()
+    started = asyncio.Event()
+
+    async def handle(partition: DinnerPartition, jobs: List[SerializedJob]) -> None:
+        started.set()
+        await asyncio.sleep(60)
+
+    async def run() -> None:
+        scheduler.register("reminder", handle)
+        scheduler.start([])
+        scheduler.schedule(PARTITION, make_jobs("reminder", 1, 3, 0.01))
+        await asyncio.wait_for(started.wait(), 1)
+        scheduler.stop()
+        await asyncio.sleep(0.01)
+
+    loop.run_until_complete(run())
+    assert len(DBService.get_jobs(PARTITION)) == 3
@@ -0,0 +1,97 @@
+import json
+from typing import List
+
+import storage
+from constants import SerializedMysteryDinner, SerializedUser
+from storage import JournaledDinnerStore
+
+
+def make_user(user_id: int) -> SerializedUser:
+    return {"display_name": f"user{user_id}", "id": user_id, "name": "", "bot": False}
+
+
+def make_dinner(user_ids: List[int]) -> SerializedMysteryDinner:
+    return {
+        "calendar": {"id": "event", "uri": None},
+        "pairings": [
+            {
+                "user": make_user(user_id),
+                "matched_with": make_user(user_ids[(i + 1) % len(user_ids)]),
+            }
+            for i, user_id in enumerate(user_ids)
+        ],
+        "id": 0,
+        "datetime_iso": "2021-01-01T19:00:00",
+    }
+
+
+def test_latest_and_recent_are_newest_first(tmpdir):
+    store = JournaledDinnerStore(str(tmpdir.join("db.json")))
+    assert store.get_latest() is None
+    assert store.get_recent(2) == []
+    for user_id in (1, 2, 3):
+        store.create(make_dinner([user_id, 10]))
+    assert store.get_latest()["id"] == 3
+    assert [dinner["id"] for dinner in store.get_recent(2)] == [3, 2]
+    assert store.cancel_latest()["id"] == 3
+    assert store.get_latest()["id"] == 2
+
+
+def test_legacy_db_is_migrated_on_compaction(tmpdir):
+    path = str(tmpdir.join("db.json"))
+    legacy = [dict(make_dinner([1, 2]), id=1), dict(make_dinner([2, 3]), id=2)]
+    with open(path, "w") as f:
+        json.dump(legacy, f)
+    store = JournaledDinnerStore(path)
+    assert store.get_latest()["id"] == 2
+    assert [dinner["id"] for dinner in store.get_recent(5)] == [2, 1]
+    assert [dinner["id"] for dinner in store.get_dinners_for_user(2)] == [1, 2]
+    assert store.create(make_dinner([4, 5]))["id"] == 3
+    store.compact()
+    with open(path) as f:
+        snapshot = json.load(f)
+    assert snapshot["next_id"] == 4
+    assert [dinner["id"] for dinner in snapshot["dinners"]] == [1, 2, 3]
+
+
+def test_torn_journal_tail_is_dropped(tmpdir):
+    path = str(tmpdir.join("db.json"))
+    store = JournaledDinnerStore(path)
+    store.create(make_dinner([1, 2]))
+    with open(store.journal_path, "a") as f:
+        f.write('{"op": "create", "dinner": {"id"')
+    reopened = JournaledDinnerStore(path)
+    assert [dinner["id"] for dinner in reopened.get_all()] == [1]
+    # the torn line is truncated so the next append starts on a clean line
+    assert reopened.create(make_dinner([3, 4]))["id"] == 2
+    assert [dinner["id"] for dinner in JournaledDinnerStore(path).get_all()] == [1, 2]
+
+
+def test_journal_is_compacted_into_snapshot(tmpdir, monkeypatch):
+    monkeypatch.setattr(storage, "COMPACT_EVERY", 3)
+    path = str(tmpdir.join("db.json"))
+    store = JournaledDinnerStore(path)
+    for user_id in range(4):
+        store.create(make_dinner([user_id, 10]))
+    store.cancel_latest()
+    with open(store.journal_path) as f:
+        assert len(f.readlines()) == 2
+    reopened = JournaledDinnerStore(path)
+    assert [dinner["id"] for dinner in reopened.get_all()] == [1, 2, 3]
+    assert reopened.get_latest()["id"] == 3
+    assert reopened.create(make_dinner([5, 6]))["id"] == 5
+
+
+def test_reload_picks_up_writes_from_another_store(tmpdir):
+    path = str(tmpdir.join("db.json"))
+    store = JournaledDinnerStore(path)
+    store.create(make_dinner([1, 2]))
+    other = JournaledDinnerStore(path)
+    other.create(make_dinner([3, 4]))
+    version = store.version
+    store.reload_if_changed()
+    assert store.version > version
+    assert store.get_latest()["id"] == 2
+    assert [dinner["id"] for dinner in store.get_dinners_for_user(3)] == [2]
+    store.reload_if_changed()
+    assert store.version == version + 1